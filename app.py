@@ -1,13 +1,12 @@
 import streamlit as st
 import os
-import json
 from pathlib import Path
 
 # Import components
 from components.player import render_player
 from components.search import render_search
-from components.library import render_library
-from components.playlists import render_playlists
+from components.library import render_library, get_local_library
+from components.playlists import render_playlists, flush_playlists, load_playlists
 from utils.network_utils import check_internet_connection
 from utils.audio_manager import AudioManager
 
@@ -19,6 +18,23 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+CSS_FILE = Path(__file__).parent / "static" / "gotify.css"
+
+@st.cache_data(show_spinner=False)
+def load_css(css_file):
+    """Read the stylesheet once and wrap it for st.html"""
+    return f"<style>\n{Path(css_file).read_text(encoding='utf-8')}</style>"
+
+@st.cache_resource
+def get_audio_manager():
+    """Create the audio backend once and share it across sessions"""
+    return AudioManager()
+
+@st.cache_data(ttl=30, show_spinner=False)
+def get_connection_status():
+    """Probe connectivity, sharing the result across sessions for a short window"""
+    return check_internet_connection(max_age=0)
+
 # Initialize session state
 def initialize_session_state():
     if 'current_track' not in st.session_state:
@@ -32,71 +48,19 @@ def initialize_session_state():
     if 'volume' not in st.session_state:
         st.session_state.volume = 0.7
     if 'audio_manager' not in st.session_state:
-        st.session_state.audio_manager = AudioManager()
-    if 'local_library' not in st.session_state:
-        st.session_state.local_library = load_local_library()
+        st.session_state.audio_manager = get_audio_manager()
     if 'playlists' not in st.session_state:
-        st.session_state.playlists = {}
+        st.session_state.playlists = load_playlists()
     if 'network_connected' not in st.session_state:
-        st.session_state.network_connected = check_internet_connection()
+        st.session_state.network_connected = get_connection_status()
     if 'page' not in st.session_state:
         st.session_state.page = "🏠 Home"
 
-def load_local_library():
-    """Load local music library from JSON file"""
-    library_file = Path("data/local_library.json")
-    if library_file.exists():
-        with open(library_file, 'r') as f:
-            return json.load(f)
-    return {"tracks": [], "artists": {}, "albums": {}}
-
-def save_local_library():
-    """Save local music library to JSON file"""
-    library_file = Path("data/local_library.json")
-    library_file.parent.mkdir(exist_ok=True)
-    with open(library_file, 'w') as f:
-        json.dump(st.session_state.local_library, f, indent=2)
-
 def main():
     initialize_session_state()
     
     # Custom CSS for Spotify-like appearance
-    st.markdown("""
-    <style>
-    /* Main app background */
-    .stApp {
-        background-color: #121212;
-        color: #ffffff;
-    }
-
-    /* Card for displaying tracks */
-    .track-card {
-        background-color: #181818;
-        padding: 1rem;
-        border-radius: 8px;
-        margin: 0.5rem 0;
-        transition: background-color 0.2s;
-    }
-    .track-card:hover {
-        background-color: #282828;
-    }
-
-    /* Sidebar styling */
-    .sidebar .sidebar-content {
-        background-color: #040404;
-    }
-
-    .main-content {
-        /* No longer need padding since player is in sidebar */
-    }
-
-    /* Hide the volume slider's value tooltip by targeting its container */
-    .volume-slider-container div[data-testid="stSlider"] > div[data-baseweb="slider"] > div:nth-child(3) {
-        display: none;
-    }
-
-    </style>
-    """, unsafe_allow_html=True)
+    st.html(load_css(str(CSS_FILE)))
     
     # Header
     # Sidebar navigation
@@ -110,7 +74,8 @@ def main():
             st.warning("📶 Offline")
             
         if st.button("🔄 Refresh Connection"):
-            st.session_state.network_connected = check_internet_connection()
+            get_connection_status.clear()
+            st.session_state.network_connected = get_connection_status()
             st.rerun()
         
         st.divider()
@@ -133,7 +98,7 @@ def main():
         st.divider()
         
         # Quick stats
-        st.metric("Local Tracks", len(st.session_state.local_library.get("tracks", [])))
+        st.metric("Local Tracks", len(get_local_library().get("tracks", [])))
         st.metric("Playlists", len(st.session_state.playlists))
 
         # --- Music Player in Sidebar ---
@@ -153,6 +118,10 @@ def main():
         render_playlists()
     st.markdown('</div>', unsafe_allow_html=True)
     
+    # Write playlist changes once per run, however many edits happened.
+    # Edits followed by st.rerun() are picked up at the end of the next run.
+    flush_playlists()
+    
 
 def render_home():
     """Render the home page with recently played and recommendations"""
@@ -162,8 +131,8 @@ def render_home():
     
     with col1:
         st.subheader("🎵 Now Playing")
-        if st.session_state.current_track:
-            track = st.session_state.current_track
+        track = st.session_state.current_track
+        if track:
             st.markdown(f"""
             <div class="track-card">
                 <h4>{track.get('title', 'Unknown Title')}</h4>
@@ -178,7 +147,7 @@ def render_home():
         st.subheader("📊 Quick Stats")
         
         # Display library statistics
-        local_tracks = len(st.session_state.local_library.get("tracks", []))
+        local_tracks = len(get_local_library().get("tracks", []))
         total_playlists = len(st.session_state.playlists)
         
         st.metric("Local Library", f"{local_tracks} tracks")
@@ -191,11 +160,15 @@ def render_home():
     
     # Recent activity
     st.subheader("🕒 Recent Activity")
-    if st.session_state.current_playlist:
-        st.write("**Current Playlist:**")
-        for i, track in enumerate(st.session_state.current_playlist[:5]):
-            status = "▶️" if i == st.session_state.current_track_index else "⏸️"
-            st.write(f"{status} {track.get('title', 'Unknown')} - {track.get('artist', 'Unknown')}")
+    current_playlist = st.session_state.current_playlist
+    if current_playlist:
+        current_index = st.session_state.current_track_index
+        # One markdown element for the whole list instead of one per track
+        lines = ["**Current Playlist:**"]
+        for i, track in enumerate(current_playlist[:5]):
+            status = "▶️" if i == current_index else "⏸️"
+            lines.append(f"{status} {track.get('title', 'Unknown')} - {track.get('artist', 'Unknown')}")
+        st.markdown("  \n".join(lines))
     else:
         st.info("No recent activity")
     
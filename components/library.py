@@ -1,14 +1,57 @@
 import streamlit as st
+import bisect
 import json
+import math
 import os
+import numpy as np
+import pandas as pd
+import queue
+import threading
+import zlib
 from pathlib import Path
+from utils.json_utils import dumps, loads
 try:
     from mutagen import File
+    from mutagen.easymp4 import EasyMP4
+    from mutagen.flac import FLAC
     from mutagen.id3 import ID3NoHeaderError
+    from mutagen.mp3 import EasyMP3
+    # Format-specific readers skip File()'s probe of every registered format;
+    # the Easy variants only map the handful of frames we actually read
+    TAG_READERS = {'.mp3': EasyMP3, '.flac': FLAC, '.m4a': EasyMP4}
 except ImportError:
     # Fallback if imports fail
     File = None
     ID3NoHeaderError = Exception
+    TAG_READERS = {}
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+LIBRARY_FILE = Path("data/tracks.ndjson")
+LEGACY_LIBRARY_FILE = Path("data/local_library.json")
+
+# Sort option label -> (frame column, ascending)
+SORT_COLUMNS = {
+    "Title": ('title_lc', True),
+    "Artist": ('artist_lc', True),
+    "Album": ('album_lc', True),
+    "Date Added": ('date_added', False),
+}
+
+# Tracks rendered per page in the "All Tracks" view
+PAGE_SIZE = 50
+
+# Background threads reading tags from uploaded files
+METADATA_WORKERS = 8
+
+# Number of appended tracks after which the track log is rewritten in one go
+COMPACT_THRESHOLD = 500
+
+def _library_file_key(library_file):
+    """Hash a library path by its modification time so edits invalidate the cache"""
+    return (str(library_file), library_file.stat().st_mtime_ns if library_file.exists() else 0)
 
 def render_library():
     """Render the local music library management page"""
@@ -32,68 +75,104 @@ def render_library():
 
 def render_all_tracks():
     """Display all tracks in the library"""
-    tracks = st.session_state.local_library.get("tracks", [])
+    library = get_local_library()
     
-    if not tracks:
+    if not library.get("tracks"):
         st.info("Your local library is empty. Upload some music files to get started!")
         return
     
     # Search within library
     search_term = st.text_input("🔍 Search your library", placeholder="Search by title, artist, or album...")
     
-    # Filter tracks based on search
-    if search_term:
-        filtered_tracks = [
-            track for track in tracks
-            if (search_term.lower() in track.get('title', '').lower() or
-                search_term.lower() in track.get('artist', '').lower() or
-                search_term.lower() in track.get('album', '').lower())
-        ]
-    else:
-        filtered_tracks = tracks
-    
     # Sort options
     sort_by = st.selectbox(
         "Sort by",
-        ["Title", "Artist", "Album", "Date Added"],
+        list(SORT_COLUMNS),
         index=0
     )
     
-    # Sort tracks
-    if sort_by == "Title":
-        filtered_tracks.sort(key=lambda x: x.get('title', '').lower())
-    elif sort_by == "Artist":
-        filtered_tracks.sort(key=lambda x: x.get('artist', '').lower())
-    elif sort_by == "Album":
-        filtered_tracks.sort(key=lambda x: x.get('album', '').lower())
-    elif sort_by == "Date Added":
-        filtered_tracks.sort(key=lambda x: x.get('date_added', ''), reverse=True)
+    # Uploads index into the shared library from other sessions; take a consistent
+    # snapshot of the tracks, frame and sort order so they all cover the same tracks
+    column, _ = SORT_COLUMNS[sort_by]
+    with library['lock']:
+        tracks = list(library["tracks"])
+        frame = get_tracks_frame(library)
+        sort_order = list(library['order'][column])
+    
+    # Filter the pre-sorted track order in one vectorized pass over the columnar view
+    order = filter_tracks(_library_signature(tracks), search_term, sort_by, frame, sort_order)
+    filtered_tracks = [tracks[i] for i in order]
     
     st.write(f"Showing {len(filtered_tracks)} tracks")
     
+    # Only render one page of rows; each row is several widgets
+    page_count = max(1, math.ceil(len(filtered_tracks) / PAGE_SIZE))
+    page = 1
+    if page_count > 1:
+        page = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1)
+    start = (page - 1) * PAGE_SIZE
+    
     # Display tracks
-    for i, track in enumerate(filtered_tracks):
+    for i, track in enumerate(filtered_tracks[start:start + PAGE_SIZE], start):
         display_library_track(track, i)
 
+def _library_signature(tracks):
+    """Cheap identifier for the current library contents, used as a cache key"""
+    if not tracks:
+        return "0"
+    return f"{len(tracks)}:{tracks[-1].get('file_path', '')}"
+
+def get_tracks_frame(library):
+    """Columnar view of the library for filtering, rebuilt when tracks are added.
+    Call with library['lock'] held.
+    """
+    tracks = library.get("tracks", [])
+    frame = library.get('frame')
+    
+    if frame is None or len(frame) != len(tracks):
+        frame = pd.DataFrame(library.get("search_keys", []), columns=['title_lc', 'artist_lc', 'album_lc'])
+        library['frame'] = frame
+    
+    return frame
+
+# Derived views are small lists of indices; bound how many (version, search, sort) combos are kept
+@st.cache_data(max_entries=16, show_spinner=False)
+def filter_tracks(library_version, term, sort_by, _frame, _order):
+    """Return indices of tracks matching the search term, in the requested sort order"""
+    order = np.asarray(_order, dtype=np.intp)
+    if term:
+        term = term.lower()
+        mask = (
+            _frame['title_lc'].str.contains(term, regex=False) |
+            _frame['artist_lc'].str.contains(term, regex=False) |
+            _frame['album_lc'].str.contains(term, regex=False)
+        ).to_numpy()
+        order = order[mask[order]]
+    
+    _, ascending = SORT_COLUMNS[sort_by]
+    if not ascending:
+        order = order[::-1]
+    return order.tolist()
+
 def render_artists_view():
     """Display library organized by artists"""
-    tracks = st.session_state.local_library.get("tracks", [])
-    artists = {}
-    
-    # Group tracks by artist
-    for track in tracks:
-        artist = track.get('artist', 'Unknown Artist')
-        if artist not in artists:
-            artists[artist] = []
-        artists[artist].append(track)
+    library = get_local_library()
+    tracks = library.get("tracks", [])
+    # Artist -> track indices, built at load time and kept current on upload
+    with library['lock']:
+        artists = sorted(library.get("artists", {}).items())
     
     if not artists:
         st.info("No artists found in your library.")
         return
     
     # Display artists
-    for artist, artist_tracks in sorted(artists.items()):
-        with st.expander(f"👨‍🎤 {artist} ({len(artist_tracks)} tracks)"):
+    for artist, track_indices in artists:
+        # A toggle acts as the header: unlike an expander, a closed one renders no body widgets
+        if not st.toggle(f"👨‍🎤 {artist} ({len(track_indices)} tracks)", key=f"exp_artist_{artist}"):
+            continue
+        artist_tracks = [tracks[i] for i in track_indices]
+        with st.container(border=True):
             col1, col2 = st.columns([1, 3])
             
             with col1:
@@ -112,54 +191,52 @@ def render_artists_view():
                 with col2:
                     st.write(f"💿 {track.get('album', 'Unknown Album')}")
                 with col3:
-                    if st.button("▶️", key=f"play_track_{track.get('file_path', '')}_{artist}"):
+                    if st.button("▶️", key=f"play_art_{track['id']}"):
                         play_single_track(track)
 
 def render_albums_view():
     """Display library organized by albums"""
-    tracks = st.session_state.local_library.get("tracks", [])
-    albums = {}
-    
-    # Group tracks by album
-    for track in tracks:
-        album = track.get('album', 'Unknown Album')
-        artist = track.get('artist', 'Unknown Artist')
-        album_key = f"{album} - {artist}"
-        
-        if album_key not in albums:
-            albums[album_key] = {
-                'album': album,
-                'artist': artist,
-                'tracks': []
-            }
-        albums[album_key]['tracks'].append(track)
+    library = get_local_library()
+    tracks = library.get("tracks", [])
+    # "Album - Artist" -> track indices, built at load time and kept current on upload
+    with library['lock']:
+        albums = sorted(library.get("albums", {}).items())
     
     if not albums:
         st.info("No albums found in your library.")
         return
     
     # Display albums
-    for album_key, album_data in sorted(albums.items()):
-        with st.expander(f"💿 {album_data['album']} by {album_data['artist']} ({len(album_data['tracks'])} tracks)"):
+    for album_key, track_indices in albums:
+        first_track = tracks[track_indices[0]]
+        album_label = (
+            f"💿 {first_track.get('album', 'Unknown Album')} by "
+            f"{first_track.get('artist', 'Unknown Artist')} ({len(track_indices)} tracks)"
+        )
+        # A toggle acts as the header: unlike an expander, a closed one renders no body widgets
+        if not st.toggle(album_label, key=f"exp_album_{album_key}"):
+            continue
+        album_tracks = [tracks[i] for i in track_indices]
+        with st.container(border=True):
             col1, col2 = st.columns([1, 3])
             
             with col1:
                 if st.button(f"▶️ Play Album", key=f"play_album_{album_key}"):
-                    play_artist_tracks(album_data['tracks'])
+                    play_artist_tracks(album_tracks)
             
             with col2:
                 if st.button(f"➕ Add to Playlist", key=f"add_album_{album_key}"):
-                    add_tracks_to_playlist(album_data['tracks'])
+                    add_tracks_to_playlist(album_tracks)
             
             # List tracks
-            for i, track in enumerate(album_data['tracks'], 1):
+            for i, track in enumerate(album_tracks, 1):
                 col1, col2, col3 = st.columns([1, 3, 1])
                 with col1:
                     st.write(f"{i:02d}")
                 with col2:
                     st.write(f"🎵 {track.get('title', 'Unknown Title')}")
                 with col3:
-                    if st.button("▶️", key=f"play_track_{track.get('file_path', '')}_{album_key}"):
+                    if st.button("▶️", key=f"play_alb_{track['id']}"):
                         play_single_track(track)
 
 def render_file_upload():
@@ -175,49 +252,104 @@ def render_file_upload():
     
     if uploaded_files:
         if st.button("📥 Add to Library", type="primary"):
-            progress_bar = st.progress(0)
-            total_files = len(uploaded_files)
+            results = st.session_state.setdefault('upload_results', queue.Queue())
+            jobs = _metadata_jobs()
+            date_added = str(st.session_state.get('current_time', ''))
+            queued = 0
             
-            for i, uploaded_file in enumerate(uploaded_files):
+            # Files are written here; tag parsing happens on the background workers
+            for uploaded_file in uploaded_files:
                 try:
-                    # Save file
                     file_path = save_uploaded_file(uploaded_file)
-                    
-                    # Extract metadata
-                    metadata = extract_metadata(file_path)
-                    
-                    # Add to library
-                    track_data = {
-                        'title': metadata.get('title', uploaded_file.name),
-                        'artist': metadata.get('artist', 'Unknown Artist'),
-                        'album': metadata.get('album', 'Unknown Album'),
-                        'file_path': str(file_path),
-                        'file_size': uploaded_file.size,
-                        'date_added': str(st.session_state.get('current_time', '')),
-                        'source': 'local'
-                    }
-                    
-                    # Check if track already exists
-                    existing_track = next(
-                        (track for track in st.session_state.local_library.get('tracks', [])
-                         if track.get('file_path') == str(file_path)), None
-                    )
-                    
-                    if not existing_track:
-                        st.session_state.local_library.setdefault('tracks', []).append(track_data)
-                        st.success(f"Added: {track_data['title']}")
-                    else:
-                        st.warning(f"Already exists: {track_data['title']}")
-                    
-                    # Update progress
-                    progress_bar.progress((i + 1) / total_files)
-                        
                 except Exception as e:
                     st.error(f"Error processing {uploaded_file.name}: {str(e)}")
+                    continue
                 
-                # Save library
-                save_local_library()
-                st.success(f"Successfully processed {total_files} files!")
+                # Defaults for anything the tags don't provide
+                track_data = {
+                    'title': uploaded_file.name,
+                    'artist': 'Unknown Artist',
+                    'album': 'Unknown Album',
+                    'file_path': str(file_path),
+                    'file_size': uploaded_file.size,
+                    'date_added': date_added,
+                    'source': 'local'
+                }
+                jobs.put((track_data, results))
+                queued += 1
+            
+            st.session_state.pending_uploads = st.session_state.get('pending_uploads', 0) + queued
+            st.session_state.upload_total = st.session_state.get('upload_total', 0) + queued
+    
+    if st.session_state.get('pending_uploads', 0):
+        render_upload_progress()
+
+@st.fragment(run_every="1s")
+def render_upload_progress():
+    """Collect tracks finished by the metadata workers and show import progress"""
+    results = st.session_state.upload_results
+    library = get_local_library()
+    new_tracks = []
+    
+    # The library is shared by every session, so index and write under its lock
+    with library['lock']:
+        while True:
+            try:
+                track_data = results.get_nowait()
+            except queue.Empty:
+                break
+            st.session_state.pending_uploads -= 1
+            
+            # Check if track already exists
+            if track_data['file_path'] not in library['paths']:
+                _index_track(library, track_data)
+                new_tracks.append(track_data)
+            else:
+                st.session_state.upload_skipped = st.session_state.get('upload_skipped', 0) + 1
+        
+        # One write for everything collected this tick
+        if new_tracks:
+            append_tracks(new_tracks)
+    
+    total_files = st.session_state.upload_total
+    pending = st.session_state.pending_uploads
+    if pending:
+        st.progress((total_files - pending) / total_files, text=f"Indexing {pending} of {total_files} files...")
+        return
+    
+    # Compact the track log once enough appends have piled up
+    if library['dirty_count'] >= COMPACT_THRESHOLD:
+        with library['lock']:
+            save_local_library()
+    
+    # One summary toast for the whole batch rather than one per file
+    skipped = st.session_state.get('upload_skipped', 0)
+    message = f"Successfully processed {total_files} files!"
+    if skipped:
+        message += f" {skipped} already in your library."
+    st.session_state.upload_total = 0
+    st.session_state.upload_skipped = 0
+    st.toast(message)
+    # Full rerun so the track, artist and album views pick up the new tracks
+    st.rerun()
+
+@st.cache_resource
+def _metadata_jobs():
+    """Start the shared metadata workers once per server and return their job queue"""
+    jobs = queue.Queue()
+    for _ in range(METADATA_WORKERS):
+        threading.Thread(target=_metadata_worker, args=(jobs,), daemon=True).start()
+    return jobs
+
+def _metadata_worker(jobs):
+    """Fill in tags for queued uploads and hand them back to the submitting session"""
+    while True:
+        track_data, results = jobs.get()
+        try:
+            track_data.update(extract_metadata(track_data['file_path']))
+        finally:
+            # Always report back, otherwise the session waits on this file forever
+            results.put(track_data)
 
 def save_uploaded_file(uploaded_file):
     """Save uploaded file to local storage"""
@@ -235,27 +367,17 @@ def save_uploaded_file(uploaded_file):
 def extract_metadata(file_path):
     """Extract metadata from audio file"""
     try:
-        audio_file = File(file_path)
+        reader = TAG_READERS.get(Path(file_path).suffix.lower())
+        audio_file = reader(file_path) if reader else File(file_path, easy=True)
         if audio_file is None:
             return {}
         
+        # Every reader above exposes the same lowercase, list-valued keys
         metadata = {}
-        
-        # Common tags
-        if 'TIT2' in audio_file:  # Title
-            metadata['title'] = str(audio_file['TIT2'])
-        elif 'TITLE' in audio_file:
-            metadata['title'] = str(audio_file['TITLE'][0])
-        
-        if 'TPE1' in audio_file:  # Artist
-            metadata['artist'] = str(audio_file['TPE1'])
-        elif 'ARTIST' in audio_file:
-            metadata['artist'] = str(audio_file['ARTIST'][0])
-        
-        if 'TALB' in audio_file:  # Album
-            metadata['album'] = str(audio_file['TALB'])
-        elif 'ALBUM' in audio_file:
-            metadata['album'] = str(audio_file['ALBUM'][0])
+        for key in ('title', 'artist', 'album'):
+            values = audio_file.get(key)
+            if values:
+                metadata[key] = str(values[0])
         
         return metadata
         
@@ -316,10 +438,121 @@ def add_track_to_playlist_modal(track):
     
     st.info(f"Would add '{track.get('title', 'Unknown')}' to selected playlist")
 
-def save_local_library():
-    """Save the local library to JSON file"""
-    library_file = Path("data/local_library.json")
+def _iter_library_tracks(library_file):
+    """Yield track dicts from the NDJSON track log, one per line"""
+    with open(library_file, 'rb') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield loads(line)
+            except json.JSONDecodeError:
+                # A crash mid-append can leave a torn last line; skip it
+                continue
+
+def _iter_legacy_tracks(library_file):
+    """Yield track dicts from the old single-document JSON library"""
+    if ijson is None:
+        with open(library_file, 'r') as f:
+            yield from json.load(f).get('tracks', [])
+        return
+    
+    # Parse incrementally so the raw text and the full document are never held together
+    with open(library_file, 'rb') as f:
+        yield from ijson.items(f, 'tracks.item', use_float=True)
+
+def _index_track(library, track):
+    """Add a track to the in-memory library and its artist/album indices"""
+    index = len(library['tracks'])
+    # Stable across restarts (unlike hash()), and short enough for widget keys
+    track.setdefault('id', zlib.crc32(track.get('file_path', '').encode()))
+    library['tracks'].append(track)
+    
+    artist = track.get('artist', 'Unknown Artist')
+    album_key = f"{track.get('album', 'Unknown Album')} - {artist}"
+    library['artists'].setdefault(artist, []).append(index)
+    library['albums'].setdefault(album_key, []).append(index)
+    library['paths'].add(track.get('file_path'))
+    # Lowercased once here so library search doesn't call .lower() per track per keystroke
+    library['search_keys'].append((
+        track.get('title', '').lower(),
+        track.get('artist', '').lower(),
+        track.get('album', '').lower()
+    ))
+    
+    # Keep each sort order current; a full load builds them in one go instead
+    if library.get('order') is not None:
+        for column, key in _sort_keys(library).items():
+            bisect.insort(library['order'][column], index, key=key)
+
+def _sort_keys(library):
+    """Sort key (track index -> value) for each sortable column"""
+    tracks = library['tracks']
+    search_keys = library['search_keys']
+    return {
+        'title_lc': lambda i: search_keys[i][0],
+        'artist_lc': lambda i: search_keys[i][1],
+        'album_lc': lambda i: search_keys[i][2],
+        'date_added': lambda i: tracks[i].get('date_added', ''),
+    }
+
+# hash_funcs matches on the concrete class (PosixPath/WindowsPath), not Path itself
+@st.cache_data(persist="disk", show_spinner=False, hash_funcs={type(LIBRARY_FILE): _library_file_key})
+def load_local_library(library_file):
+    """Load local music library from the NDJSON track log"""
+    library = {"tracks": [], "artists": {}, "albums": {}, "search_keys": [], "paths": set()}
+    
+    if library_file.exists():
+        tracks = _iter_library_tracks(library_file)
+    elif LEGACY_LIBRARY_FILE.exists():
+        tracks = _iter_legacy_tracks(LEGACY_LIBRARY_FILE)
+    else:
+        tracks = ()
+    
+    for track in tracks:
+        _index_track(library, track)
+    
+    # Track indices pre-sorted by every sort option, so rendering never sorts
+    library['order'] = {
+        column: sorted(range(len(library['tracks'])), key=key)
+        for column, key in _sort_keys(library).items()
+    }
+    
+    return library
+
+@st.cache_resource
+def get_local_library():
+    """The in-memory library, loaded once and shared by every session"""
+    library = load_local_library(LIBRARY_FILE)
+    library['lock'] = threading.Lock()
+    library['dirty_count'] = 0
+    return library
+
+def append_tracks(tracks, library_file=LIBRARY_FILE):
+    """Append tracks to the on-disk track log"""
+    if not library_file.exists():
+        # First write (or migration from the legacy JSON): snapshot everything
+        save_local_library(library_file)
+        return
+    
+    with open(library_file, 'ab') as f:
+        f.write(b"".join(dumps(track) + b"\n" for track in tracks))
+    
+    get_local_library()['dirty_count'] += len(tracks)
+    load_local_library.clear()
+
+def save_local_library(library_file=LIBRARY_FILE):
+    """Rewrite the track log from the in-memory library, compacting it"""
     library_file.parent.mkdir(exist_ok=True)
     
-    with open(library_file, 'w') as f:
-        json.dump(st.session_state.local_library, f, indent=2)
+    library = get_local_library()
+    tmp_file = library_file.with_suffix('.ndjson.tmp')
+    with open(tmp_file, 'wb') as f:
+        for track in library.get('tracks', []):
+            f.write(dumps(track) + b"\n")
+    os.replace(tmp_file, library_file)
+    
+    library['dirty_count'] = 0
+    # The cached copy is keyed on mtime, but drop it explicitly so stale entries don't pile up
+    load_local_library.clear()
@@ -1,5 +1,18 @@
 import streamlit as st
-import time
+import pandas as pd
+import random
+import requests
+import threading
+from functools import lru_cache
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+# Repeat modes cycle off -> playlist -> track
+_REPEAT_ICON = {'off': '🔁', 'playlist': '🔁', 'track': '🔂'}
+_NEXT_MODE = {'off': 'playlist', 'playlist': 'track', 'track': 'off'}
+_REPEAT_TOAST = {mode: f"Repeat mode: {mode.title()}" for mode in _NEXT_MODE}
+
+# Seconds between progress ticks while playing
+PROGRESS_INTERVAL = 1.0
 
 def set_volume():
     """Callback to set volume from the slider.
@@ -8,9 +21,12 @@ def set_volume():
     st.session_state.volume = st.session_state.volume_slider # Sync the main volume state
     st.session_state.audio_manager.set_volume(st.session_state.volume)
 
+@st.fragment
 def render_player():
-    """Render the music player component"""
-
+    """Render the music player component.
+    Runs as a fragment so player interactions (seek, volume, live progress)
+    rerun only the player instead of the whole page.
+    """
     if not st.session_state.current_track:
         st.info("No track selected. Search for music or select from your library.")
         return
@@ -18,18 +34,15 @@ def render_player():
     track = st.session_state.current_track
     audio_manager = st.session_state.audio_manager
 
-    # Handle song finishing
-    if st.session_state.get('song_finished', False):
-        st.session_state.song_finished = False # Reset flag
-        next_track(autoplay=True) # Move to next track
-        st.rerun()
-    
     # --- Vertical Layout for Sidebar ---
 
     # Album Art and Track Info
     album_art_url = track.get('album_art') or track.get('thumbnail')
     if album_art_url:
-        st.image(album_art_url)
+        try:
+            st.image(_art_bytes(album_art_url))
+        except requests.RequestException:
+            st.image(album_art_url)
     st.markdown(f"**{track.get('title', 'Unknown Title')}**")
     st.caption(f"*{track.get('artist', 'Unknown Artist')}*")
 
@@ -49,28 +62,12 @@ def render_player():
         if st.button("⏭️", help="Next track"):
             next_track()
 
-    # Progress bar and seeking
-    position = audio_manager.get_position()
-    duration_ms = audio_manager.get_duration()
-
-    if duration_ms > 0:
-        # Use a slider for seeking
-        new_position = st.slider(
-            "Track Progress", 0.0, 1.0, position,
-            label_visibility="collapsed", key="seek_slider",
-            on_change=lambda: audio_manager.set_position(st.session_state.seek_slider)
-        )
-        if abs(new_position - position) > 0.01 and not st.session_state.is_playing:
-            audio_manager.set_position(new_position)
-            st.rerun()
-        
-        # Timestamps
-        current_time_str = format_duration(position * duration_ms)
-        total_time_str = format_duration(duration_ms)
-        st.caption(f"{current_time_str} / {total_time_str}")
-
+    # Progress bar and seeking; only poll while something is playing, so a
+    # paused or stopped player costs no reruns at all
+    if st.session_state.is_playing:
+        _live_progress(audio_manager)
     else:
-        st.progress(0)
+        render_progress(audio_manager)
 
     # Secondary Controls (Shuffle/Repeat) and Volume
     c1, c2, c3 = st.columns([1, 1, 3])
@@ -79,8 +76,7 @@ def render_player():
             shuffle_playlist()
     with c2:
         repeat_mode = st.session_state.get('repeat_mode', 'off')
-        repeat_icons = {'off': '🔁', 'playlist': '🔁', 'track': '🔂'}
-        if st.button(repeat_icons[repeat_mode], help="Toggle Repeat (Off -> Playlist -> Track)"):
+        if st.button(_REPEAT_ICON[repeat_mode], help="Toggle Repeat (Off -> Playlist -> Track)"):
             toggle_repeat()
     
     with c3:
@@ -94,31 +90,106 @@ def render_player():
         )
         st.markdown('</div>', unsafe_allow_html=True)
 
-    # To make the progress bar and seeking feel "live", force a rerun if playing.
-    if st.session_state.is_playing:
-        st.rerun() # Reruns to update the progress bar
-    
-    # Playlist queue
-    if st.session_state.current_playlist:
+    # Playlist queue: a single selectable table instead of one button per track
+    playlist = st.session_state.current_playlist
+    if playlist:
         with st.expander("📝 Current Queue"):
-            for i, queue_track in enumerate(st.session_state.current_playlist):
-                status = "▶️" if i == st.session_state.current_track_index else ""
-                if st.button(
-                    f"{status} {queue_track.get('title', 'Unknown')} - {queue_track.get('artist', 'Unknown')}",
-                    key=f"queue_{i}",
-                    use_container_width=True
-                ):
-                    st.session_state.current_track_index = i
-                    st.session_state.current_track = queue_track
-                    play_track()
- 
+            current_index = st.session_state.current_track_index
+            queue_df = pd.DataFrame({
+                "": ["▶️" if i == current_index else "" for i in range(len(playlist))],
+                "Title": [queue_track.get('title', 'Unknown') for queue_track in playlist],
+                "Artist": [queue_track.get('artist', 'Unknown') for queue_track in playlist],
+            })
+            # Keyed on the playing index so a fresh table (with no stale selection) follows every track change
+            event = st.dataframe(
+                queue_df, hide_index=True, key=f"queue_table_{current_index}",
+                on_select="rerun", selection_mode="single-row"
+            )
+            # Selecting the row already playing keeps the same key (and selection) after the rerun,
+            # so it must not restart the track, or every later run would restart it again
+            if event.selection.rows and event.selection.rows[0] != current_index:
+                i = event.selection.rows[0]
+                st.session_state.update(current_track_index=i, current_track=playlist[i])
+                play_track()
+
+def render_progress(audio_manager):
+    """Progress bar, seek slider and timestamps"""
+    # Handle song finishing
+    if audio_manager.song_finished.is_set():
+        audio_manager.song_finished.clear()
+        st.session_state.is_playing = False
+        next_track(autoplay=True) # Move to next track
+        st.rerun()
+
+    position = audio_manager.get_position()
+    # A track's length doesn't change; ask VLC only until it reports one.
+    # Keyed on the track itself, since other pages switch tracks without going through play_track
+    track = st.session_state.current_track
+    cached = st.session_state.get('current_duration')
+    if cached and cached[0] is track:
+        duration_ms = cached[1]
+    else:
+        duration_ms = audio_manager.get_duration()
+        if duration_ms > 0:
+            st.session_state.current_duration = (track, duration_ms)
+
+    if duration_ms > 0:
+        def seek():
+            audio_manager.set_position(st.session_state.seek_slider)
+
+        # Use a slider for seeking; on_change covers both playing and paused tracks.
+        # It fires once per release, not per drag step, so every change is applied
+        st.slider(
+            "Track Progress", 0.0, 1.0, position,
+            label_visibility="collapsed", key="seek_slider",
+            on_change=seek
+        )
+        
+        # Timestamps
+        current_time_str = format_duration(position * duration_ms)
+        total_time_str = format_duration(duration_ms)
+        st.caption(f"{current_time_str} / {total_time_str}")
+
+    else:
+        st.progress(0)
+
+# While playing, the progress section ticks on its own so it reruns only these few widgets.
+# Seeks rerun it immediately anyway, and the timestamps only show whole seconds
+_live_progress = st.fragment(run_every=PROGRESS_INTERVAL)(render_progress)
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def _art_bytes(url):
+    """Download album art once; failures raise so they aren't cached"""
+    response = requests.get(url, timeout=3)
+    response.raise_for_status()
+    return response.content
+
+def _prefetch_art(track):
+    """Warm the album art cache for a track in the background"""
+    url = track.get('album_art') or track.get('thumbnail')
+    if not url:
+        return
+
+    def fetch():
+        try:
+            _art_bytes(url)
+        except requests.RequestException:
+            pass
+
+    thread = threading.Thread(target=fetch, daemon=True)
+    add_script_run_ctx(thread, get_script_run_ctx())
+    thread.start()
+
 def format_duration(ms: int) -> str:
     """Formats duration in milliseconds to MM:SS"""
     if ms is None or ms < 0:
         return "00:00"
-    seconds = int((ms / 1000) % 60)
-    minutes = int((ms / (1000 * 60)) % 60)
-    return f"{minutes:02d}:{seconds:02d}"
+    return _format_seconds(int(ms) // 1000)
+
+@lru_cache(maxsize=4096)
+def _format_seconds(seconds: int) -> str:
+    # Minutes are not wrapped at 60, so tracks over an hour read e.g. 75:03
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
 
 def play_track(resume=False):
     """Play the current track, or resume if paused."""
@@ -126,10 +197,19 @@ def play_track(resume=False):
         track = st.session_state.current_track
         audio_manager = st.session_state.audio_manager
 
-        if resume and not audio_manager.player.is_playing():
+        if resume and not audio_manager.is_busy():
             audio_manager.resume()
         else:
             audio_manager.play_track(track)
+            st.session_state.pop('current_duration', None)
+            # Have the next track's art and stream URL ready by the time we skip to it
+            playlist = st.session_state.current_playlist
+            next_index = st.session_state.current_track_index + 1
+            if next_index < len(playlist):
+                up_next = playlist[next_index]
+                _prefetch_art(up_next)
+                if up_next.get('source') == 'youtube':
+                    audio_manager.prefetch(up_next.get('id'))
         st.success(f"Playing: {track.get('title', 'Unknown')}")
         
         # Optimistically update the UI and rerun
@@ -145,9 +225,10 @@ def pause_track():
 
 def next_track(autoplay=False):
     """Skip to next track in playlist"""
-    if st.session_state.current_playlist:
+    playlist = st.session_state.current_playlist
+    if playlist:
         current_index = st.session_state.current_track_index
-        playlist_len = len(st.session_state.current_playlist)
+        playlist_len = len(playlist)
         repeat_mode = st.session_state.get('repeat_mode', 'off')
 
         next_index = current_index + 1
@@ -158,54 +239,47 @@ def next_track(autoplay=False):
             return
 
         if next_index < playlist_len:
-            st.session_state.current_track_index = next_index
-            st.session_state.current_track = st.session_state.current_playlist[next_index]
+            st.session_state.update(current_track_index=next_index, current_track=playlist[next_index])
             play_track()
         elif repeat_mode == 'playlist':
             # Loop back to the start
-            st.session_state.current_track_index = 0
-            st.session_state.current_track = st.session_state.current_playlist[0]
+            st.session_state.update(current_track_index=0, current_track=playlist[0])
             play_track()
         else:
             st.warning("End of playlist")
 
 def previous_track():
     """Go to previous track in playlist"""
-    if st.session_state.current_playlist:
+    playlist = st.session_state.current_playlist
+    if playlist:
         current_index = st.session_state.current_track_index
         if current_index > 0:
-            st.session_state.current_track_index = current_index - 1
-            st.session_state.current_track = st.session_state.current_playlist[current_index - 1]
+            st.session_state.update(current_track_index=current_index - 1, current_track=playlist[current_index - 1])
             play_track()
         else:
             st.warning("Already at first track")
 
 def shuffle_playlist():
     """Shuffle the current playlist"""
-    import random
-    if st.session_state.current_playlist:
-        current_track = st.session_state.current_track
-        shuffled = st.session_state.current_playlist.copy()
-        random.shuffle(shuffled)
-        st.session_state.current_playlist = shuffled
-        # Find the current track in the shuffled list
-        for i, track in enumerate(shuffled):
-            if track == current_track:
-                st.session_state.current_track_index = i
-                break
+    playlist = st.session_state.current_playlist
+    if playlist:
+        index = st.session_state.current_track_index
+        if 0 <= index < len(playlist) and playlist[index] is st.session_state.current_track:
+            # Shuffle the rest and keep the current track at the front, instead of searching for it afterwards
+            others = playlist[:index] + playlist[index + 1:]
+            random.shuffle(others)
+            st.session_state.update(current_playlist=[playlist[index]] + others, current_track_index=0)
+        else:
+            shuffled = playlist.copy()
+            random.shuffle(shuffled)
+            st.session_state.current_playlist = shuffled
         st.success("Playlist shuffled!")
 
 def toggle_repeat():
     """Toggle repeat mode"""
-    modes = ['off', 'playlist', 'track']
     current_mode = st.session_state.get('repeat_mode', 'off')
-    try:
-        current_index = modes.index(current_mode)
-        next_index = (current_index + 1) % len(modes)
-        st.session_state.repeat_mode = modes[next_index]
-    except ValueError:
-        st.session_state.repeat_mode = 'off'
+    new_mode = _NEXT_MODE.get(current_mode, 'off')
+    st.session_state.repeat_mode = new_mode
     
-    mode_text = st.session_state.repeat_mode.replace('_', ' ').title()
-    st.toast(f"Repeat mode: {mode_text}")
+    st.toast(_REPEAT_TOAST[new_mode])
     st.rerun()
@@ -1,6 +1,18 @@
 import streamlit as st
-import json
+import math
+import os
+import random
 from pathlib import Path
+from streamlit.errors import StreamlitAPIException
+from utils.json_utils import dumps, loads
+
+PLAYLISTS_FILE = Path("data/playlists.json")
+
+# Tracks rendered per page inside an expanded playlist
+PAGE_SIZE = 50
+
+# Row icon per track source; local files and anything else get 💿
+SRC_EMOJI = {'spotify': '🎵', 'youtube': '📺'}
 
 def render_playlists():
     """Render the playlist management page"""
@@ -24,36 +36,61 @@ def render_playlist_list():
         return
     
     # Display playlists
-    for playlist_name, tracks in playlists.items():
-        with st.expander(f"📝 {playlist_name} ({len(tracks)} tracks)", expanded=False):
-            
-            # Playlist controls
-            col1, col2, col3, col4 = st.columns(4)
-            
-            with col1:
-                if st.button("▶️ Play All", key=f"play_playlist_{playlist_name}"):
-                    play_playlist(playlist_name)
-            
-            with col2:
-                if st.button("🔀 Shuffle", key=f"shuffle_playlist_{playlist_name}"):
-                    shuffle_and_play_playlist(playlist_name)
-            
-            with col3:
-                if st.button("✏️ Rename", key=f"rename_playlist_{playlist_name}"):
-                    rename_playlist(playlist_name)
-            
-            with col4:
-                if st.button("🗑️ Delete", key=f"delete_playlist_{playlist_name}"):
-                    delete_playlist(playlist_name)
-            
-            st.divider()
-            
-            # Display tracks in playlist
-            if tracks:
-                for i, track in enumerate(tracks):
-                    display_playlist_track(track, i, playlist_name)
-            else:
-                st.info("This playlist is empty. Add some tracks from your library or search results.")
+    for playlist_name in list(playlists):
+        render_playlist(playlist_name)
+
+@st.fragment
+def render_playlist(playlist_name):
+    """Display one playlist.
+    Runs as a fragment so reordering or removing tracks reruns only this playlist.
+    """
+    tracks = st.session_state.playlists.get(playlist_name)
+    if tracks is None:
+        return
+    
+    with st.expander(f"📝 {playlist_name} ({len(tracks)} tracks)", expanded=False):
+        
+        # Playlist controls
+        col1, col2, col3, col4 = st.columns(4)
+        
+        with col1:
+            if st.button("▶️ Play All", key=f"play_playlist_{playlist_name}"):
+                play_playlist(playlist_name)
+        
+        with col2:
+            if st.button("🔀 Shuffle", key=f"shuffle_playlist_{playlist_name}"):
+                shuffle_and_play_playlist(playlist_name)
+        
+        with col3:
+            if st.button("✏️ Rename", key=f"rename_playlist_{playlist_name}"):
+                rename_playlist(playlist_name)
+        
+        with col4:
+            if st.button("🗑️ Delete", key=f"delete_playlist_{playlist_name}"):
+                delete_playlist(playlist_name)
+        
+        st.divider()
+        
+        # Display tracks in playlist
+        if tracks:
+            # Only render one page of rows; each row is several widgets
+            page_count = math.ceil(len(tracks) / PAGE_SIZE)
+            page = 1
+            if page_count > 1:
+                page_key = f"playlist_page_{playlist_name}"
+                # Removing tracks can leave the remembered page past the end
+                if st.session_state.get(page_key, 1) > page_count:
+                    st.session_state[page_key] = page_count
+                page = st.number_input("Page", min_value=1, max_value=page_count, step=1, key=page_key)
+            start = (page - 1) * PAGE_SIZE
+            rows = playlist_rows(playlist_name)[start:start + PAGE_SIZE]
+            for i, (track, row) in enumerate(zip(tracks[start:start + PAGE_SIZE], rows), start):
+                display_playlist_track(track, i, playlist_name, row)
+        else:
+            st.info("This playlist is empty. Add some tracks from your library or search results.")
+
+    # Fragment reruns skip the flush at the end of the app run
+    flush_playlists()
 
 def render_create_playlist():
     """Interface for creating new playlists"""
@@ -94,7 +131,7 @@ def render_create_playlist():
                     'track_count': 0
                 }
                 
-                save_playlists()
+                mark_playlists_dirty()
                 st.success(f"✅ Created playlist '{playlist_name}'!")
                 st.rerun()
     
@@ -115,29 +152,23 @@ def render_create_playlist():
         if st.button("💖 Liked Songs", use_container_width=True):
             create_template_playlist("Liked Songs", "Songs I've liked")
 
-def display_playlist_track(track, index, playlist_name):
+def display_playlist_track(track, index, playlist_name, row):
     """Display a single track in a playlist"""
-    col1, col2, col3, col4, col5, col6 = st.columns([3, 2, 2, 1, 1, 1])
+    # Track info goes out as one markdown element; only the actions are widgets
+    col_info, col_play, col_up, col_del = st.columns([7, 1, 1, 1])
     
-    with col1:
-        source_emoji = "🎵" if track.get('source') == 'spotify' else "📺" if track.get('source') == 'youtube' else "💿"
-        st.write(f"{source_emoji} **{track.get('title', 'Unknown Title')}**")
+    with col_info:
+        st.markdown(row)
     
-    with col2:
-        st.write(f"👨‍🎤 {track.get('artist', 'Unknown Artist')}")
-    
-    with col3:
-        st.write(f"💿 {track.get('album', 'Unknown Album')}")
-    
-    with col4:
+    with col_play:
         if st.button("▶️", key=f"play_track_{playlist_name}_{index}", help="Play"):
             play_track_from_playlist(track, playlist_name, index)
     
-    with col5:
+    with col_up:
         if st.button("⬆️", key=f"move_up_{playlist_name}_{index}", help="Move up"):
             move_track_up(playlist_name, index)
     
-    with col6:
+    with col_del:
         if st.button("🗑️", key=f"remove_track_{playlist_name}_{index}", help="Remove"):
             remove_track_from_playlist(playlist_name, index)
 
@@ -149,25 +180,26 @@ def play_playlist(playlist_name):
         st.warning("Playlist is empty")
         return
     
-    st.session_state.current_playlist = tracks.copy()
+    # Queue the playlist itself rather than a copy; edits below keep the queue position in step
+    st.session_state.current_playlist = tracks
     st.session_state.current_track_index = 0
     st.session_state.current_track = tracks[0]
     st.session_state.is_playing = True
     
     st.success(f"▶️ Playing playlist '{playlist_name}' ({len(tracks)} tracks)")
+    # The player and queue live outside this fragment, so rerun the whole app
+    st.rerun()
 
 def shuffle_and_play_playlist(playlist_name):
     """Shuffle and play a playlist"""
-    import random
-    
     tracks = st.session_state.playlists.get(playlist_name, [])
     
     if not tracks:
         st.warning("Playlist is empty")
         return
     
-    shuffled_tracks = tracks.copy()
-    random.shuffle(shuffled_tracks)
+    # random.sample builds the shuffled queue in one pass, leaving the playlist's own order alone
+    shuffled_tracks = random.sample(tracks, len(tracks))
     
     st.session_state.current_playlist = shuffled_tracks
     st.session_state.current_track_index = 0
@@ -175,17 +207,19 @@ def shuffle_and_play_playlist(playlist_name):
     st.session_state.is_playing = True
     
     st.success(f"🔀 Shuffling and playing '{playlist_name}' ({len(tracks)} tracks)")
+    st.rerun()
 
 def play_track_from_playlist(track, playlist_name, track_index):
     """Play a specific track from a playlist"""
     tracks = st.session_state.playlists.get(playlist_name, [])
     
-    st.session_state.current_playlist = tracks.copy()
+    st.session_state.current_playlist = tracks
     st.session_state.current_track_index = track_index
     st.session_state.current_track = track
     st.session_state.is_playing = True
     
     st.success(f"▶️ Playing: {track.get('title', 'Unknown')} from '{playlist_name}'")
+    st.rerun()
 
 def move_track_up(playlist_name, track_index):
     """Move a track up in the playlist"""
@@ -194,9 +228,15 @@ def move_track_up(playlist_name, track_index):
     if track_index > 0:
         # Swap tracks
         tracks[track_index], tracks[track_index - 1] = tracks[track_index - 1], tracks[track_index]
-        save_playlists()
+        if st.session_state.current_playlist is tracks:
+            current_index = st.session_state.current_track_index
+            if current_index == track_index:
+                st.session_state.current_track_index = track_index - 1
+            elif current_index == track_index - 1:
+                st.session_state.current_track_index = track_index
+        touch_playlist(playlist_name)
         st.success("Track moved up")
-        st.rerun()
+        rerun_playlist()
     else:
         st.warning("Track is already at the top")
 
@@ -206,9 +246,13 @@ def remove_track_from_playlist(playlist_name, track_index):
     
     if 0 <= track_index < len(tracks):
         removed_track = tracks.pop(track_index)
-        save_playlists()
+        if st.session_state.current_playlist is tracks and st.session_state.current_track_index > track_index:
+            st.session_state.current_track_index -= 1
+        # Rebuilt on next use; another entry may share the removed id
+        st.session_state.get('playlist_id_index', {}).pop(playlist_name, None)
+        touch_playlist(playlist_name)
         st.success(f"Removed '{removed_track.get('title', 'Unknown')}' from playlist")
-        st.rerun()
+        rerun_playlist()
     else:
         st.error("Invalid track index")
 
@@ -227,7 +271,11 @@ def rename_playlist(old_name):
             else:
                 # Rename playlist
                 st.session_state.playlists[new_name] = st.session_state.playlists.pop(old_name)
-                save_playlists()
+                id_index = st.session_state.get('playlist_id_index', {})
+                if old_name in id_index:
+                    id_index[new_name] = id_index.pop(old_name)
+                st.session_state.get('playlist_rows', {}).pop(new_name, None)
+                touch_playlist(old_name)
                 st.success(f"Renamed playlist to '{new_name}'")
                 st.rerun()
         else:
@@ -242,7 +290,8 @@ def delete_playlist(playlist_name):
     with col1:
         if st.button("✅ Yes, Delete", key=f"confirm_delete_{playlist_name}", type="primary"):
             del st.session_state.playlists[playlist_name]
-            save_playlists()
+            st.session_state.get('playlist_id_index', {}).pop(playlist_name, None)
+            touch_playlist(playlist_name)
             st.success(f"Deleted playlist '{playlist_name}'")
             st.rerun()
     
@@ -256,26 +305,74 @@ def create_template_playlist(name, description):
         st.error(f"Playlist '{name}' already exists")
     else:
         st.session_state.playlists[name] = []
-        save_playlists()
+        mark_playlists_dirty()
         st.success(f"Created playlist '{name}'")
         st.rerun()
 
+def playlist_rows(playlist_name):
+    """Display line for each track in a playlist.
+    Kept per session and rebuilt only after touch_playlist marks the playlist changed.
+    """
+    memo = st.session_state.setdefault('playlist_rows', {})
+    rows = memo.get(playlist_name)
+    if rows is None:
+        rows = []
+        for track in st.session_state.playlists.get(playlist_name, []):
+            rows.append(
+                f"{SRC_EMOJI.get(track.get('source'), '💿')} **{track.get('title', 'Unknown Title')}** — "
+                f"*{track.get('artist', 'Unknown Artist')}* · _{track.get('album', 'Unknown Album')}_"
+            )
+        memo[playlist_name] = rows
+    return rows
+
+def touch_playlist(playlist_name):
+    """Mark a playlist's tracks as changed: drop its display rows and schedule a save"""
+    st.session_state.get('playlist_rows', {}).pop(playlist_name, None)
+    mark_playlists_dirty()
+
+def rerun_playlist():
+    """Rerun just the playlist fragment, or the whole app if this isn't a fragment rerun"""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+def playlist_track_ids(playlist_name):
+    """Set of track ids in a playlist, for O(1) duplicate checks.
+    Built on first use and kept in step by the add/remove/rename/delete paths.
+    """
+    id_index = st.session_state.setdefault('playlist_id_index', {})
+    if playlist_name not in id_index:
+        tracks = st.session_state.playlists.get(playlist_name, [])
+        id_index[playlist_name] = {track.get('id') for track in tracks}
+    return id_index[playlist_name]
+
+def mark_playlists_dirty():
+    """Note that playlists changed; they're written once by flush_playlists at the end of the run"""
+    st.session_state.playlists_dirty = True
+
+def flush_playlists():
+    """Save playlists if anything changed since the last save"""
+    if st.session_state.get('playlists_dirty', False):
+        save_playlists()
+        st.session_state.playlists_dirty = False
+
 def save_playlists():
     """Save playlists to local storage"""
-    # In a real application, this would save to a file or database
-    # For now, playlists are stored in session state
-    playlists_file = Path("data/playlists.json")
-    playlists_file.parent.mkdir(exist_ok=True)
+    PLAYLISTS_FILE.parent.mkdir(exist_ok=True)
     
-    with open(playlists_file, 'w') as f:
-        json.dump(st.session_state.playlists, f, indent=2)
+    # Write a temp file and swap it in, so a crash mid-write can't truncate the playlists
+    tmp_file = PLAYLISTS_FILE.with_suffix('.json.tmp')
+    with open(tmp_file, 'wb') as f:
+        f.write(dumps(st.session_state.playlists, indent=True))
+    os.replace(tmp_file, PLAYLISTS_FILE)
 
 def load_playlists():
     """Load playlists from local storage"""
-    playlists_file = Path("data/playlists.json")
+    playlists_file = PLAYLISTS_FILE
     
-    if playlists_file.exists():
-        with open(playlists_file, 'r') as f:
-            return json.load(f)
+    if not playlists_file.exists() or playlists_file.stat().st_size == 0:
+        return {}
     
-    return {}
+    # One read of the raw bytes; orjson parses them without decoding to str first
+    return loads(playlists_file.read_bytes())
@@ -1,8 +1,28 @@
 import streamlit as st
-import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from components.playlists import playlist_track_ids, touch_playlist
 from utils.spotify_client import SpotifyClient
 from utils.youtube_client import YouTubeClient
-from utils.network_utils import check_internet_connection
+from utils.network_utils import check_internet_connection, pooled_session
+
+SOURCE_NAMES = {'spotify': "Spotify", 'youtube': "YouTube"}
+
+# Results shown per source; only this many are fetched, cached and kept in session state
+MAX_RESULTS = 10
+# Top YouTube results whose stream URLs are resolved in the background after a search
+PREFETCH_TOP = 3
+
+@st.cache_resource
+def get_spotify_client():
+    """One authenticated Spotify client shared across reruns and sessions"""
+    return SpotifyClient(session=pooled_session())
+
+@st.cache_resource
+def get_youtube_client():
+    """One YouTube client shared across reruns and sessions"""
+    return YouTubeClient(session=pooled_session())
 
 def render_search():
     """Render the search page for online music discovery"""
@@ -11,7 +31,7 @@ def render_search():
     if not st.session_state.network_connected:
         st.error("🌐 No internet connection. Search functionality requires online access.")
         if st.button("🔄 Retry Connection"):
-            st.session_state.network_connected = check_internet_connection()
+            st.session_state.network_connected = check_internet_connection(max_age=0)
             st.rerun()
         return
     
@@ -27,49 +47,88 @@ def render_search():
         
         col1, col2, col3 = st.columns([1, 1, 2])
         with col1:
-            search_spotify = st.checkbox("🎵 Spotify", value=True)
+            use_spotify = st.checkbox("🎵 Spotify", value=True)
         with col2:
-            search_youtube = st.checkbox("📺 YouTube", value=True)
+            use_youtube = st.checkbox("📺 YouTube", value=True)
         
         # The form is submitted when the user presses Enter in the text_input.
         if st.form_submit_button("Search", use_container_width=True, type="primary"):
             if search_query:
                 with st.spinner("Searching for music..."):
-                    st.session_state.search_results = perform_search(search_query, search_spotify, search_youtube)
+                    st.session_state.search_results, messages = perform_search(search_query, use_spotify, use_youtube)
+                for level, message in messages:
+                    getattr(st, level)(message)
 
     if st.session_state.search_results:
         display_search_results(st.session_state.search_results)
 
 
+class _NoResults(Exception):
+    """Raised from the cached searches so empty (possibly failed) lookups aren't cached"""
+
+@st.cache_data(ttl=300, max_entries=256, show_spinner=False)
+def search_spotify(query):
+    """Spotify track search, cached per query"""
+    results = get_spotify_client().search(query, limit=MAX_RESULTS)
+    if not results:
+        raise _NoResults()
+    return results
+
+@st.cache_data(ttl=300, max_entries=256, show_spinner=False)
+def search_youtube(query):
+    """YouTube search, cached per query"""
+    results = get_youtube_client().search(query, max_results=MAX_RESULTS)
+    if not results:
+        raise _NoResults()
+    return results
+
 def perform_search(query, include_spotify=True, include_youtube=True):
-    """Perform search across selected platforms"""
+    """Perform search across selected platforms.
+    Returns the results and a list of (level, message) notices for the caller to show.
+    """
     results = {
         'spotify': [],
         'youtube': []
     }
+    messages = []
     
-    # Search Spotify
+    # Queue up the enabled sources so they can be fetched concurrently
+    searches = {}
     if include_spotify:
-        try:
-            spotify_client = SpotifyClient()
-            if spotify_client.is_configured:
-                spotify_results = spotify_client.search(query)
-                results['spotify'] = spotify_results
-            else:
-                st.warning("Spotify credentials are not configured. Please set `SPOTIFY_CLIENT_ID` and `SPOTIFY_CLIENT_SECRET` environment variables to enable Spotify search.")
-        except Exception as e:
-            st.error(f"Spotify search failed: {str(e)}")
-    
-    # Search YouTube
+        if get_spotify_client().is_configured:
+            searches['spotify'] = search_spotify
+        else:
+            messages.append(('warning', "Spotify credentials are not configured. Please set `SPOTIFY_CLIENT_ID` and `SPOTIFY_CLIENT_SECRET` environment variables to enable Spotify search."))
     if include_youtube:
-        try:
-            youtube_client = YouTubeClient()
-            youtube_results = youtube_client.search(query)
-            results['youtube'] = youtube_results
-        except Exception as e:
-            st.error(f"YouTube search failed: {str(e)}")
+        searches['youtube'] = search_youtube
     
-    return results
+    if not searches:
+        return results, messages
+    
+    # Both searches are blocking HTTP calls, so the total wait is the slower one rather than the sum
+    ctx = get_script_run_ctx()
+    with ThreadPoolExecutor(
+        max_workers=len(searches),
+        initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx)
+    ) as executor:
+        futures = {executor.submit(search, query): source for source, search in searches.items()}
+        for future in as_completed(futures):
+            source = futures[future]
+            try:
+                results[source] = future.result()
+                # Stable per-track key for the result widgets, computed once here instead of on every render
+                for r in results[source]:
+                    r['_uid'] = r.get('id') or f"{source}:{r.get('url') or r.get('title')}"
+            except _NoResults:
+                pass
+            except Exception as e:
+                messages.append(('error', f"{SOURCE_NAMES[source]} search failed: {str(e)}"))
+    
+    # Start resolving the likeliest picks while the user reads the results
+    for track in results['youtube'][:PREFETCH_TOP]:
+        st.session_state.audio_manager.prefetch(track.get('id'))
+    
+    return results, messages
 
 def display_search_results(results):
     """Display search results in organized tabs"""
@@ -86,22 +145,23 @@ def display_search_results(results):
         return
     
     tab_objects = st.tabs(tabs)
+    playlist_names = list(st.session_state.playlists.keys())
     
     # Display Spotify results
     if results['spotify'] and "🎵 Spotify" in tabs:
         with tab_objects[tabs.index("🎵 Spotify")]:
             st.subheader("Spotify Results")
-            for track in results['spotify'][:10]:  # Show top 10 results
-                display_track_card(track, source="spotify")
+            for track in results['spotify']:
+                display_track_card(track, "spotify", playlist_names)
     
     # Display YouTube results
     if results['youtube'] and "📺 YouTube" in tabs:
         with tab_objects[tabs.index("📺 YouTube")]:
             st.subheader("YouTube Results")
-            for track in results['youtube'][:10]:  # Show top 10 results
-                display_track_card(track, source="youtube")
+            for track in results['youtube']:
+                display_track_card(track, "youtube", playlist_names)
 
-def display_track_card(track, source):
+def display_track_card(track, source, playlist_names):
     """Display individual track card with play and add options"""
     
     with st.container(border=True):
@@ -124,18 +184,18 @@ def display_track_card(track, source):
                 st.markdown(f"🔥 {track['popularity']}/100")
         
         with col3:
-            if st.button("▶️", key=f"play_{track.get('id', hash(str(track)))}", help="Play now"):
+            if st.button("▶️", key=f"play_{track['_uid']}", help="Play now"):
                 play_track_from_search(track, source)
         
         with col4:
-            if st.button("➕", key=f"add_{track.get('id', hash(str(track)))}", help="Add to playlist"):
+            if st.button("➕", key=f"add_{track['_uid']}", help="Add to playlist"):
                 # Set the track to be added in session state to show the form
-                st.session_state.track_to_add = track.get('id', hash(str(track)))
+                st.session_state.track_to_add = track['_uid']
                 st.rerun()
 
     # If a track is selected to be added, show the form
-    if st.session_state.get('track_to_add') == track.get('id', hash(str(track))):
-        add_track_to_playlist_form(track, source)
+    if st.session_state.get('track_to_add') == track['_uid']:
+        add_track_to_playlist_form(track, source, playlist_names)
 
 
 def play_track_from_search(track, source, add_to_queue=False):
@@ -146,7 +206,7 @@ def play_track_from_search(track, source, add_to_queue=False):
         if source == 'spotify':
             with st.spinner(f"Finding '{track.get('title')}' on YouTube..."):
                 # For Spotify, find the equivalent on YouTube to stream
-                youtube_client = YouTubeClient()
+                youtube_client = get_youtube_client()
                 query = f"{track.get('title')} {track.get('artist')}"
                 yt_results = youtube_client.search(query, max_results=1)
 
@@ -182,22 +242,20 @@ def play_track_from_search(track, source, add_to_queue=False):
     except Exception as e:
         st.error(f"Failed to play track: {str(e)}")
 
-def add_track_to_playlist_form(track, source):
+def add_track_to_playlist_form(track, source, playlist_names):
     """Display a form to add a track to a playlist."""
-    playlist_names = list(st.session_state.playlists.keys())
-
     if not playlist_names:
         st.warning("No playlists found. Create a playlist first.")
-        if st.button("Cancel", key=f"cancel_add_{track.get('id')}"):
+        if st.button("Cancel", key=f"cancel_add_{track['_uid']}"):
             del st.session_state.track_to_add
             st.rerun()
         return
 
-    with st.form(f"add_to_playlist_{track.get('id', hash(str(track)))}"):
+    with st.form(f"add_to_playlist_{track['_uid']}"):
         selected_playlist = st.selectbox(
             "Select playlist",
             playlist_names,
-            key=f"playlist_select_{track.get('id', hash(str(track)))}"
+            key=f"playlist_select_{track['_uid']}"
         )
 
         col1, col2 = st.columns(2)
@@ -219,13 +277,12 @@ def add_track_to_playlist_form(track, source):
             if selected_playlist not in st.session_state.playlists:
                 st.session_state.playlists[selected_playlist] = []
 
-            track_exists = any(
-                existing_track.get('id') == track_data.get('id')
-                for existing_track in st.session_state.playlists[selected_playlist]
-            )
+            track_ids = playlist_track_ids(selected_playlist)
 
-            if not track_exists:
+            if track_data.get('id') not in track_ids:
                 st.session_state.playlists[selected_playlist].append(track_data)
+                track_ids.add(track_data.get('id'))
+                touch_playlist(selected_playlist)
                 st.success(f"Added '{track_data['title']}' to '{selected_playlist}'")
             else:
                 st.warning("Track already exists in this playlist")
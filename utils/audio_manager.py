@@ -1,15 +1,107 @@
 from pathlib import Path
-import vlc
-import yt_dlp
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import streamlit as st
 
+# Seconds between background samples of playback position/length
+POLL_INTERVAL = 0.1
+
+# Milliseconds of network stream VLC reads ahead before and during playback (its default is 1000)
+NETWORK_CACHING_MS = 5000
+
+# VLC options: audio only, so "best" fallbacks with a video track aren't decoded or shown,
+# with a deeper network read-ahead so YouTube streams ride out network jitter
+VLC_ARGS = ['--no-video', f'--network-caching={NETWORK_CACHING_MS}']
+
+# Upper bound on outstanding stream URL prefetches, and how long play_track waits on one
+PREFETCH_LIMIT = 8
+PREFETCH_WAIT = 5
+
+# Stream URLs are signed and expire after a few hours; keep well inside that
+STREAM_URL_TTL = 3600
+
+# Long-lived YoutubeDL instances: extractor setup happens once each, and the player JS
+# used to decipher stream URLs is kept in cachedir between runs
+YDL_OPTS = {
+    'format': 'bestaudio/best',
+    'quiet': True,
+    'no_warnings': True,
+    'skip_download': True,
+    'youtube_include_dash_manifest': False,
+    # Progressive https formats are all VLC needs; skip fetching DASH/HLS manifests entirely
+    'extractor_args': {'youtube': {'skip': ['dash', 'hls'], 'player_skip': ['configs']}},
+    'cachedir': str(Path.home() / '.cache' / 'gotify-ytdlp'),
+}
+
+# Idle instances kept for reuse: one per prefetch worker plus one for a direct play,
+# so a play never waits behind speculative prefetches for an instance
+YDL_POOL_SIZE = 3
+_idle_ydls = []
+_ydl_lock = threading.Lock()
+
+@contextmanager
+def _borrow_ydl():
+    """Lend an idle YoutubeDL, building one if none is free (instances aren't thread-safe)"""
+    with _ydl_lock:
+        ydl = _idle_ydls.pop() if _idle_ydls else None
+    if ydl is None:
+        # Deferred so app startup doesn't pay for importing yt-dlp's extractors
+        import yt_dlp
+        ydl = yt_dlp.YoutubeDL(YDL_OPTS)
+    try:
+        yield ydl
+    finally:
+        with _ydl_lock:
+            keep = len(_idle_ydls) < YDL_POOL_SIZE
+            if keep:
+                _idle_ydls.append(ydl)
+        if not keep:
+            ydl.close()
+
+def _best_audio_url(info):
+    """Pick a stream URL from unprocessed extractor output, preferring audio-only at the highest bitrate"""
+    if info.get('url'):
+        return info['url']
+    formats = [f for f in info.get('formats') or [] if f.get('url') and f.get('acodec') != 'none']
+    if not formats:
+        raise ValueError("No audio stream found")
+    best = max(formats, key=lambda f: (f.get('vcodec') == 'none', f.get('abr') or 0))
+    return best['url']
+
+@st.cache_data(ttl=STREAM_URL_TTL, max_entries=512, show_spinner=False)
+def resolve_stream_url(video_id):
+    """Resolve a YouTube video id to its best audio stream URL.
+    Raises on failure so that errors are not cached.
+    """
+    with _borrow_ydl() as ydl:
+        # process=False skips format selection and the extra manifest requests it triggers
+        info = ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=False, process=False)
+    return _best_audio_url(info)
+
 class AudioManager:
     """Manages audio playback using python-vlc."""
 
     def __init__(self):
-        self.instance = vlc.Instance()
+        # Imported here so loading this module doesn't require libvlc until playback is set up
+        import vlc
+        self.instance = vlc.Instance(VLC_ARGS)
         self.player = self.instance.media_player_new()
         self.track_info = None
+        # Stream URL lookups started ahead of time, by video id; the manager is shared by
+        # every session, so the dict is only touched under its lock
+        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='stream-prefetch')
+        self._prefetched = {}
+        self._prefetch_lock = threading.Lock()
+        # Set from VLC's event thread, consumed by the player UI
+        self.song_finished = threading.Event()
+        
+        # Position/length/playing sampled off the render path by _poll
+        self._position = 0.0
+        self._duration = 0
+        self._playing = False
+        threading.Thread(target=self._poll, daemon=True).start()
         
         # Event handling
         self.event_manager = self.player.event_manager()
@@ -17,28 +109,50 @@ class AudioManager:
         self.event_manager.event_attach(vlc.EventType.MediaPlayerPlaying, lambda e: self.update_playing_state(True))
         self.event_manager.event_attach(vlc.EventType.MediaPlayerPaused, lambda e: self.update_playing_state(False))
 
+    def _poll(self):
+        """Sample playback position, length and state at 10 Hz so the UI never waits on libvlc."""
+        while True:
+            self._position = self.player.get_position()
+            self._duration = self.player.get_length()
+            self._playing = self.player.is_playing()
+            time.sleep(POLL_INTERVAL)
+
     def _get_youtube_stream_url(self, video_id):
         """Get the best audio stream URL from a YouTube video ID."""
         if not video_id:
             return None
 
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'quiet': True,
-            'no_warnings': True,
-            'force_generic_extractor': True,
-        }
+        with self._prefetch_lock:
+            future = self._prefetched.pop(video_id, None)
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=False)
-                return info['url']
+            if future is not None:
+                try:
+                    return future.result(timeout=PREFETCH_WAIT)
+                except Exception:
+                    pass  # Slow or failed prefetch: resolve directly, which reports any error
+            return resolve_stream_url(video_id)
         except Exception as e:
             st.error(f"Error getting audio stream: {e}")
             return None
 
+    def prefetch(self, video_id):
+        """Start resolving a YouTube stream URL in the background so playing it later doesn't block."""
+        if not video_id:
+            return
+        with self._prefetch_lock:
+            if video_id in self._prefetched:
+                return
+            if len(self._prefetched) >= PREFETCH_LIMIT:
+                # Skipped tracks leave unused futures behind; their URLs stay in the cache anyway
+                self._prefetched.clear()
+            self._prefetched[video_id] = self._pool.submit(resolve_stream_url, video_id)
+
     def play_track(self, track):
         """Play a track, fetching stream URL if it's from YouTube."""
         self.stop()
+        self.song_finished.clear()
+        self._position = 0.0
+        self._duration = 0
         if not track:
             st.warning("No track provided to play.")
             return
@@ -63,6 +177,7 @@ class AudioManager:
         if media:
             self.player.set_media(media)
             self.player.play()
+            self._playing = True
             st.session_state.is_playing = True
         else:
             st.session_state.is_playing = False
@@ -70,43 +185,52 @@ class AudioManager:
     def pause(self):
         if self.player.is_playing():
             self.player.pause()
+            self._playing = False
             st.session_state.is_playing = False
 
     def resume(self):
         if not self.player.is_playing():
             self.player.play()
+            self._playing = True
             st.session_state.is_playing = True
 
     def stop(self):
         self.player.stop()
+        self._playing = False
         st.session_state.is_playing = False
 
     def set_volume(self, volume):
         """Set volume from 0.0 to 1.0"""
         self.player.audio_set_volume(int(volume * 100))
 
+    def is_busy(self):
+        """Whether a track is playing, as last sampled (or as set by the last play/pause/stop)."""
+        return self._playing
+
     def get_position(self):
-        """Get current playback position (0.0 to 1.0)."""
-        return self.player.get_position()
+        """Get current playback position (0.0 to 1.0), as last sampled."""
+        return self._position
 
     def get_duration(self):
-        """Get total duration of the track in milliseconds."""
-        return self.player.get_length()
+        """Get total duration of the track in milliseconds, as last sampled."""
+        return self._duration
 
     def set_position(self, position):
         """Set playback position (0.0 to 1.0)."""
         self.player.set_position(position)
+        self._position = position
 
     def update_playing_state(self, is_playing):
-        """Callback to update session state based on player events."""
-        st.session_state.is_playing = is_playing
+        """Callback to track playing state from player events.
+        Runs on VLC's event thread, so it only updates the manager's own sample.
+        """
+        self._playing = is_playing
 
     def song_finished_callback(self, event):
         """
         Callback triggered when a song finishes.
         This will be used to trigger the 'next_track' logic in the UI.
-        We set a flag in the session state that the UI can check on the next rerun.
+        VLC calls this on its own thread, which has no script context and so
+        can't touch session state; it sets an event on the manager instead.
         """
-        st.session_state.is_playing = False
-        # Using a flag is a safe way to communicate from a callback thread to Streamlit
-        st.session_state.song_finished = True
+        self.song_finished.set()
@@ -0,0 +1,74 @@
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional, Tuple
+from utils.json_utils import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+# Entries kept per cache file; the oldest are dropped beyond this
+DISK_CACHE_ENTRIES = 4096
+# Writes between trims, so inserts don't each pay for a DELETE
+TRIM_EVERY = 256
+
+class DiskCache:
+    """Small persistent store of JSON values in SQLite, so cached lookups survive app restarts.
+    Any failure to open or use the file only disables caching; it is never an error for callers.
+    """
+
+    def __init__(self, path: Path, max_entries: int = DISK_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._writes = 0
+        # One connection shared by every thread; sqlite3 needs them serialized
+        self._lock = threading.Lock()
+        try:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, stored REAL NOT NULL, value BLOB NOT NULL)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS cache_stored ON cache (stored)')
+        except (OSError, sqlite3.Error) as e:
+            logger.warning("Disk cache unavailable at %s: %s", path, e)
+            self._db = None
+
+    def get(self, key: str, ttl: float) -> Optional[Tuple[float, Any]]:
+        """Return (age in seconds, value) for an entry stored less than ttl seconds ago, or None"""
+        if self._db is None:
+            return None
+        try:
+            with self._lock:
+                row = self._db.execute('SELECT stored, value FROM cache WHERE key = ?', (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Disk cache read failed: %s", e)
+            return None
+        if row is None:
+            return None
+        age = time.time() - row[0]
+        if not 0 <= age < ttl:
+            return None
+        return age, loads(row[1])
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a JSON-serializable value, replacing any previous entry for key"""
+        if self._db is None:
+            return
+        try:
+            with self._lock:
+                self._db.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?)', (key, time.time(), dumps(value)))
+                self._writes += 1
+                if self._writes % TRIM_EVERY == 0:
+                    self._db.execute(
+                        'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY stored DESC LIMIT -1 OFFSET ?)',
+                        (self.max_entries,)
+                    )
+        except sqlite3.Error as e:
+            logger.warning("Disk cache write failed: %s", e)
+
+    def close(self) -> None:
+        """Close the database; later gets miss and sets are ignored"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -1,31 +1,117 @@
+import logging
 import requests
 import socket
+import streamlit as st
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
 
-def check_internet_connection(timeout: int = 5) -> bool:
+logger = logging.getLogger(__name__)
+
+# Responses at least this large are big enough to say something about throughput
+THROUGHPUT_MIN_BYTES = 64 * 1024
+# Weight of each new sample in the moving average
+THROUGHPUT_ALPHA = 0.3
+
+# Exponentially weighted download speed in bytes/s, observed from real responses
+_THROUGHPUT = {'bps': None}
+
+def _record_throughput(response: requests.Response, *args, **kwargs) -> None:
+    """Response hook: fold large downloads into the throughput average"""
+    if kwargs.get('stream'):
+        return  # Reading the body here would defeat streaming
+    started = time.monotonic()
+    size = len(response.content)
+    if size < THROUGHPUT_MIN_BYTES:
+        return
+    elapsed = response.elapsed.total_seconds() + (time.monotonic() - started)
+    if elapsed <= 0:
+        return
+    sample = size / elapsed
+    previous = _THROUGHPUT['bps']
+    _THROUGHPUT['bps'] = sample if previous is None else (1 - THROUGHPUT_ALPHA) * previous + THROUGHPUT_ALPHA * sample
+
+def get_observed_speed_kbps() -> Optional[float]:
+    """
+    Download speed seen on recent large responses from pooled sessions
+    
+    Returns:
+        float: Speed in KB/s, or None if nothing large enough has been downloaded yet
+    """
+    bps = _THROUGHPUT['bps']
+    return None if bps is None else round(bps / 1024, 2)
+
+# Nagle off for small API round trips (urllib3 already does this) plus TCP keepalive,
+# so pooled connections idling between searches aren't silently dropped by NATs
+SOCKET_OPTIONS = HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+
+class _KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections are opened with SOCKET_OPTIONS"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs.setdefault('socket_options', SOCKET_OPTIONS)
+        super().init_poolmanager(*args, **kwargs)
+
+def pooled_session(pool_connections: int = 10, pool_maxsize: int = 10) -> requests.Session:
+    """
+    Create a requests session that keeps connections alive between calls
+    
+    Args:
+        pool_connections: Number of hosts to keep connection pools for
+        pool_maxsize: Connections kept per host
+        
+    Returns:
+        requests.Session: Session with pooling adapters mounted for http and https
+    """
+    session = requests.Session()
+    adapter = _KeepAliveAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.hooks['response'].append(_record_throughput)
+    return session
+
+# Shared by the probes below so repeat checks reuse open connections
+_SESSION = pooled_session(pool_connections=4, pool_maxsize=8)
+_SESSION.headers['User-Agent'] = 'Gotify Music Player'
+
+# Last connectivity probe result, shared by callers within max_age seconds
+_LAST = {'t': 0.0, 'v': False}
+
+def check_internet_connection(timeout: int = 5, max_age: float = 10.0) -> bool:
     """
     Check if internet connection is available
     
     Args:
         timeout: Connection timeout in seconds
+        max_age: Reuse a probe result younger than this many seconds (0 forces a fresh probe)
         
     Returns:
         bool: True if connected to internet, False otherwise
     """
+    now = time.monotonic()
+    if now - _LAST['t'] < max_age:
+        return _LAST['v']
+    
     try:
-        # Try to connect to a reliable host
-        response = requests.get(
-            'https://www.google.com',
-            timeout=timeout,
-            headers={'User-Agent': 'Gotify Music Player'}
-        )
-        return response.status_code == 200
-    except (requests.RequestException, socket.timeout):
+        # A bare TCP connect to a public DNS resolver is far cheaper than an HTTPS request
+        with socket.create_connection(("1.1.1.1", 53), timeout=timeout):
+            connected = True
+    except (socket.timeout, socket.error):
         try:
-            # Fallback: try DNS resolution
-            socket.create_connection(("8.8.8.8", 53), timeout=timeout)
-            return True
-        except (socket.timeout, socket.error):
-            return False
+            # Fallback: port 53 may be filtered, so try a real web request
+            response = _SESSION.get(
+                'https://www.google.com',
+                timeout=timeout
+            )
+            connected = response.status_code == 200
+        except (requests.RequestException, socket.timeout):
+            connected = False
+    
+    _LAST['t'] = now
+    _LAST['v'] = connected
+    return connected
 
 def test_spotify_api_connection() -> bool:
     """
@@ -35,10 +121,9 @@ def test_spotify_api_connection() -> bool:
         bool: True if Spotify API is accessible, False otherwise
     """
     try:
-        response = requests.get(
+        response = _SESSION.get(
             'https://api.spotify.com/v1/',
-            timeout=5,
-            headers={'User-Agent': 'Gotify Music Player'}
+            timeout=5
         )
         # Spotify API returns 401 for unauthenticated requests, which is expected
         return response.status_code in [200, 401]
@@ -53,19 +138,21 @@ def test_youtube_api_connection() -> bool:
         bool: True if YouTube API is accessible, False otherwise
     """
     try:
-        response = requests.get(
+        response = _SESSION.get(
             'https://www.googleapis.com/youtube/v3/',
-            timeout=5,
-            headers={'User-Agent': 'Gotify Music Player'}
+            timeout=5
         )
         # YouTube API returns 400 for requests without parameters, which is expected
         return response.status_code in [200, 400]
     except requests.RequestException:
         return False
 
-def get_network_status() -> dict:
+def _uncached_get_network_status() -> dict:
     """
-    Get comprehensive network status information
+    Get comprehensive network status information, probing every time
+    
+    Outside a Streamlit app, call this directly; get_network_status is the
+    cached version for reruns.
     
     Returns:
         dict: Network status information
@@ -78,23 +165,34 @@ def get_network_status() -> dict:
     }
     
     try:
-        # Check general internet connectivity
-        status['internet'] = check_internet_connection()
-        
-        if status['internet']:
-            # Check specific API endpoints
-            status['spotify_api'] = test_spotify_api_connection()
-            status['youtube_api'] = test_youtube_api_connection()
+        # The probes are independent network round-trips, so the wait is the slowest one rather than the sum
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            internet = executor.submit(check_internet_connection)
+            spotify_api = executor.submit(test_spotify_api_connection)
+            youtube_api = executor.submit(test_youtube_api_connection)
+            status['internet'] = internet.result()
+            status['spotify_api'] = spotify_api.result()
+            status['youtube_api'] = youtube_api.result()
         
         # Overall status is true if internet is available
         status['overall'] = status['internet']
         
     except Exception as e:
-        print(f"Error checking network status: {e}")
+        logger.warning("Error checking network status: %s", e)
         # All status values remain False
     
     return status
 
+# Status changes on a human timescale; reruns within this window reuse the last probes
+get_network_status = st.cache_data(ttl=30, show_spinner=False)(_uncached_get_network_status)
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _fetch_public_ip() -> str:
+    """Look up the public IP, raising on failure so failures aren't cached"""
+    response = _SESSION.get('https://api.ipify.org', timeout=5)
+    response.raise_for_status()
+    return response.text.strip()
+
 def get_public_ip() -> str:
     """
     Get the public IP address
@@ -103,8 +201,7 @@ def get_public_ip() -> str:
         str: Public IP address or 'Unknown' if failed
     """
     try:
-        response = requests.get('https://api.ipify.org', timeout=5)
-        return response.text.strip()
+        return _fetch_public_ip()
     except requests.RequestException:
         return 'Unknown'
 
@@ -121,8 +218,8 @@ def ping_host(host: str, port: int = 80, timeout: int = 3) -> bool:
         bool: True if host is reachable, False otherwise
     """
     try:
-        socket.create_connection((host, port), timeout=timeout)
-        return True
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
     except (socket.timeout, socket.error):
         return False
 
@@ -130,17 +227,19 @@ def get_connection_speed() -> dict:
     """
     Estimate connection speed by downloading a small file
     
+    Only meant for an explicit, user-requested speed test: the file is small
+    enough that the result mostly reflects connection setup time.
+    check_streaming_capability uses get_observed_speed_kbps instead.
+    
     Returns:
         dict: Connection speed information
     """
-    import time
-    
     try:
         # Use a small file for speed test
         test_url = 'https://www.google.com/favicon.ico'
         start_time = time.time()
         
-        response = requests.get(test_url, timeout=10)
+        response = _SESSION.get(test_url, timeout=10)
         end_time = time.time()
         
         if response.status_code == 200:
@@ -200,23 +299,22 @@ def check_streaming_capability() -> dict:
             'recommendations': ['Connect to internet', 'Use offline mode']
         }
     
-    speed_test = get_connection_speed()
+    # Passive estimate from downloads the app already made; no extra request
+    speed_kbps = get_observed_speed_kbps()
     
-    if not speed_test['success']:
+    if speed_kbps is None:
         return {
-            'capable': True,  # Assume capable if we can't test
-            'reason': 'Could not test connection speed',
+            'capable': True,  # Assume capable until we've seen real traffic
+            'reason': 'Connection speed not measured yet',
             'recommendations': ['Connection appears stable']
         }
     
-    speed_kbps = speed_test.get('speed_kbps', 0)
-    
     # Music streaming typically needs 128-320 kbps
     # We'll be conservative and recommend at least 64 KB/s (512 kbps)
     if speed_kbps >= 64:
         return {
             'capable': True,
-            'quality': speed_test.get('quality', 'Unknown'),
+            'quality': get_connection_quality(speed_kbps),
             'speed_kbps': speed_kbps,
             'recommendations': ['Good for high-quality streaming']
         }
@@ -1,16 +1,39 @@
+import logging
 import os
 import requests
 import base64
-from typing import List, Dict, Optional
+import threading
+import time
+from collections import OrderedDict
+from operator import itemgetter
+from typing import Dict, Iterator, List, Optional
+from utils.json_utils import loads
+
+logger = logging.getLogger(__name__)
+
+# Most track ids the /tracks endpoint accepts in one call
+TRACKS_PER_REQUEST = 50
+
+_name = itemgetter('name')
+
+# Repeat searches within this many seconds are answered from memory
+SEARCH_CACHE_TTL = 300
+SEARCH_CACHE_SIZE = 256
 
 class SpotifyClient:
     """Client for interacting with Spotify Web API"""
     
-    def __init__(self):
+    def __init__(self, session: Optional[requests.Session] = None):
         self.client_id = os.getenv('SPOTIFY_CLIENT_ID', '')
         self.client_secret = os.getenv('SPOTIFY_CLIENT_SECRET', '')
         self.base_url = 'https://api.spotify.com/v1'
         self.access_token = None
+        self._token_expiry = 0.0
+        # (query, type, limit) -> (fetched at, results), least recently used first
+        self._search_cache = OrderedDict()
+        self._search_lock = threading.Lock()
+        # Reused for every call so the TLS connection to Spotify stays open between requests
+        self._session = session or requests.Session()
         
         if self.client_id and self.client_secret:
             self._get_access_token()
@@ -34,7 +57,7 @@ class SpotifyClient:
             
             data = {'grant_type': 'client_credentials'}
             
-            response = requests.post(
+            response = self._session.post(
                 'https://accounts.spotify.com/api/token',
                 headers=headers,
                 data=data,
@@ -42,28 +65,65 @@ class SpotifyClient:
             )
             
             if response.status_code == 200:
-                token_data = response.json()
+                token_data = loads(response.content)
                 self.access_token = token_data.get('access_token')
+                # Sent on every API call from here on; the token request above sets its own header
+                self._session.headers['Authorization'] = f'Bearer {self.access_token}'
+                # Refresh a minute early rather than let a request fail on an expired token
+                self._token_expiry = time.monotonic() + token_data.get('expires_in', 3600) - 60
                 return True
             else:
-                print(f"Failed to get Spotify token: {response.status_code}")
+                logger.warning("Failed to get Spotify token: %s", response.status_code)
                 return False
                 
         except Exception as e:
-            print(f"Error getting Spotify access token: {e}")
+            logger.warning("Error getting Spotify access token: %s", e)
             return False
     
+    def _ensure_token(self):
+        """Get a new access token if there is none yet or the current one is about to expire"""
+        if self.is_configured and (not self.access_token or time.monotonic() >= self._token_expiry):
+            self._get_access_token()
+    
     def search(self, query: str, search_type: str = 'track', limit: int = 20) -> List[Dict]:
         """Search for tracks, artists, or albums on Spotify"""
-        if not self.access_token:
-            print("No Spotify access token available")
+        key = (query.strip().lower(), search_type, limit)
+        now = time.monotonic()
+        with self._search_lock:
+            cached = self._search_cache.get(key)
+            if cached and now - cached[0] < SEARCH_CACHE_TTL:
+                self._search_cache.move_to_end(key)
+                # Copies, so callers can't modify what's cached
+                return [dict(result) for result in cached[1]]
+        
+        try:
+            results = list(self.iter_search(query, search_type, limit))
+        except Exception as e:
+            logger.warning("Error parsing Spotify results: %s", e)
             return []
         
+        if results:
+            with self._search_lock:
+                self._search_cache[key] = (now, results)
+                self._search_cache.move_to_end(key)
+                if len(self._search_cache) > SEARCH_CACHE_SIZE:
+                    self._search_cache.popitem(last=False)
+        return [dict(result) for result in results]
+    
+    def iter_search(self, query: str, search_type: str = 'track', limit: int = 20) -> Iterator[Dict]:
+        """Like search, but yields each result as it is parsed so callers can stop early"""
+        data = self._search_request(query, search_type, limit)
+        if data:
+            yield from self._iter_search_results(data, search_type)
+    
+    def _search_request(self, query: str, search_type: str, limit: int) -> Optional[Dict]:
+        """Run a search request and return the raw response body"""
+        self._ensure_token()
+        if not self.access_token:
+            logger.warning("No Spotify access token available")
+            return None
+        
         try:
-            headers = {
-                'Authorization': f'Bearer {self.access_token}'
-            }
-            
             params = {
                 'q': query,
                 'type': search_type,
@@ -71,124 +131,118 @@ class SpotifyClient:
                 'market': 'US'
             }
             
-            response = requests.get(
-                f'{self.base_url}/search',
-                headers=headers,
-                params=params,
-                timeout=10
-            )
+            for attempt in range(2):
+                response = self._session.get(
+                    f'{self.base_url}/search',
+                    params=params,
+                    timeout=10
+                )
+                
+                # Token revoked before its expiry: refresh and retry once
+                if response.status_code != 401 or attempt or not self._get_access_token():
+                    break
             
             if response.status_code == 200:
-                data = response.json()
-                return self._parse_search_results(data, search_type)
+                return loads(response.content)
             elif response.status_code == 401:
-                # Token might be expired, try to refresh
-                if self._get_access_token():
-                    return self.search(query, search_type, limit)
-                else:
-                    print("Failed to refresh Spotify token")
-                    return []
+                logger.warning("Failed to refresh Spotify token")
+                return None
             else:
-                print(f"Spotify search failed: {response.status_code}")
-                return []
+                logger.warning("Spotify search failed: %s", response.status_code)
+                return None
                 
         except Exception as e:
-            print(f"Error searching Spotify: {e}")
-            return []
+            logger.warning("Error searching Spotify: %s", e)
+            return None
     
-    def _parse_search_results(self, data: Dict, search_type: str) -> List[Dict]:
-        """Parse Spotify search results into standardized format"""
-        results = []
-        
+    def _iter_search_results(self, data: Dict, search_type: str) -> Iterator[Dict]:
+        """Parse Spotify search results into standardized format, one result at a time"""
+        # Generators over dict literals; art is None when Spotify has no images
         if search_type == 'track' and 'tracks' in data:
-            for track in data['tracks']['items']:
-                result = {
+            yield from (
+                {
                     'id': track['id'],
                     'title': track['name'],
-                    'artist': ', '.join([artist['name'] for artist in track['artists']]),
+                    'artist': ', '.join(map(_name, track['artists'])),
                     'album': track['album']['name'],
                     'duration': track['duration_ms'],
                     'popularity': track['popularity'],
                     'url': track['external_urls']['spotify'],
                     'preview_url': track.get('preview_url'),
-                    'source': 'spotify'
+                    'source': 'spotify',
+                    'album_art': track['album']['images'][0]['url'] if track['album']['images'] else None
                 }
-                
-                # Add album art if available
-                if track['album']['images']:
-                    result['album_art'] = track['album']['images'][0]['url']
-                
-                results.append(result)
+                for track in data['tracks']['items']
+            )
         
         elif search_type == 'artist' and 'artists' in data:
-            for artist in data['artists']['items']:
-                result = {
+            yield from (
+                {
                     'id': artist['id'],
                     'name': artist['name'],
                     'popularity': artist['popularity'],
                     'url': artist['external_urls']['spotify'],
                     'followers': artist['followers']['total'],
                     'genres': artist['genres'],
-                    'source': 'spotify'
+                    'source': 'spotify',
+                    'image': artist['images'][0]['url'] if artist['images'] else None
                 }
-                
-                if artist['images']:
-                    result['image'] = artist['images'][0]['url']
-                
-                results.append(result)
+                for artist in data['artists']['items']
+            )
         
         elif search_type == 'album' and 'albums' in data:
-            for album in data['albums']['items']:
-                result = {
+            yield from (
+                {
                     'id': album['id'],
                     'name': album['name'],
-                    'artist': ', '.join([artist['name'] for artist in album['artists']]),
+                    'artist': ', '.join(map(_name, album['artists'])),
                     'release_date': album['release_date'],
                     'total_tracks': album['total_tracks'],
                     'url': album['external_urls']['spotify'],
-                    'source': 'spotify'
+                    'source': 'spotify',
+                    'album_art': album['images'][0]['url'] if album['images'] else None
                 }
-                
-                if album['images']:
-                    result['album_art'] = album['images'][0]['url']
-                
-                results.append(result)
-        
-        return results
+                for album in data['albums']['items']
+            )
     
     def get_track_details(self, track_id: str) -> Optional[Dict]:
         """Get detailed information about a specific track"""
+        details = self.get_tracks_details([track_id])
+        return details[0] if details else None
+    
+    def get_tracks_details(self, track_ids: List[str]) -> List[Dict]:
+        """Get detailed information for several tracks, up to 50 per request"""
+        self._ensure_token()
         if not self.access_token:
-            return None
+            return []
         
-        try:
-            headers = {
-                'Authorization': f'Bearer {self.access_token}'
-            }
-            
-            response = requests.get(
-                f'{self.base_url}/tracks/{track_id}',
-                headers=headers,
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                track = response.json()
-                return self._parse_track_details(track)
-            else:
-                print(f"Failed to get track details: {response.status_code}")
-                return None
+        results = []
+        for start in range(0, len(track_ids), TRACKS_PER_REQUEST):
+            chunk = track_ids[start:start + TRACKS_PER_REQUEST]
+            try:
+                response = self._session.get(
+                    f'{self.base_url}/tracks',
+                    params={'ids': ','.join(chunk), 'market': 'US'},
+                    timeout=10
+                )
                 
-        except Exception as e:
-            print(f"Error getting track details: {e}")
-            return None
+                if response.status_code == 200:
+                    # Unknown ids come back as null entries
+                    results.extend(self._parse_track_details(track) for track in loads(response.content)['tracks'] if track)
+                else:
+                    logger.warning("Failed to get track details: %s", response.status_code)
+                    
+            except Exception as e:
+                logger.warning("Error getting track details: %s", e)
+        
+        return results
     
     def _parse_track_details(self, track: Dict) -> Dict:
         """Parse detailed track information"""
         result = {
             'id': track['id'],
             'title': track['name'],
-            'artist': ', '.join([artist['name'] for artist in track['artists']]),
+            'artist': ', '.join(map(_name, track['artists'])),
             'album': track['album']['name'],
             'duration': track['duration_ms'],
             'popularity': track['popularity'],
@@ -227,14 +281,11 @@ class SpotifyClient:
     def get_recommendations(self, seed_tracks: List[str] = None, seed_artists: List[str] = None, 
                            seed_genres: List[str] = None, limit: int = 20) -> List[Dict]:
         """Get track recommendations based on seeds"""
+        self._ensure_token()
         if not self.access_token:
             return []
         
         try:
-            headers = {
-                'Authorization': f'Bearer {self.access_token}'
-            }
-            
             params = {
                 'limit': limit
             }
@@ -246,20 +297,19 @@ class SpotifyClient:
             if seed_genres:
                 params['seed_genres'] = ','.join(seed_genres[:5])
             
-            response = requests.get(
+            response = self._session.get(
                 f'{self.base_url}/recommendations',
-                headers=headers,
                 params=params,
                 timeout=10
             )
             
             if response.status_code == 200:
-                data = response.json()
-                return self._parse_search_results({'tracks': data}, 'track')
+                data = loads(response.content)
+                return list(self._iter_search_results({'tracks': data}, 'track'))
             else:
-                print(f"Failed to get recommendations: {response.status_code}")
+                logger.warning("Failed to get recommendations: %s", response.status_code)
                 return []
                 
         except Exception as e:
-            print(f"Error getting recommendations: {e}")
+            logger.warning("Error getting recommendations: %s", e)
             return []
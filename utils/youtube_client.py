@@ -1,15 +1,87 @@
+import logging
 import os
 import requests
 import re
-from typing import List, Dict, Optional
-import yt_dlp
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
+from utils.disk_cache import DiskCache
+from utils.json_utils import loads
+from utils.network_utils import pooled_session
+
+logger = logging.getLogger(__name__)
+
+# Common patterns for music video titles, tried in order:
+#   Artist - Title (hyphen, en or em dash), Artist : Title / Artist | Title, Artist "Title".
+# The first two are split with str.find (see _split_title); only the quoted form needs a regex.
+_TITLE_SEPARATORS = ('-–—', ':|')
+_QUOTED_TITLE_RE = re.compile(r'(.+?)\s*"(.+?)"')
+
+# Flat search only lists entries; the ytsearchN prefix sets how many
+SEARCH_YDL_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'extract_flat': True,
+}
+
+# Signed stream URLs last about six hours; metadata rarely changes
+STREAM_CACHE_TTL = 3 * 60 * 60
+INFO_CACHE_TTL = 24 * 60 * 60
+SEARCH_CACHE_TTL = 60 * 60
+LOOKUP_CACHE_SIZE = 512
+
+# Lookups are also kept here so they survive app restarts
+DISK_CACHE_PATH = Path.home() / '.cache' / 'gotify' / 'youtube.sqlite3'
+
+# Idle YoutubeDL instances kept per kind for reuse (enough for the batch lookups' default workers);
+# extra ones made under heavier load are closed
+YDL_POOL_SIZE = 8
+
+def _split_title(title: str, separators: str) -> Optional[Tuple[str, str]]:
+    """Split a stripped title at its first separator (not at position 0) into unstripped (artist, title).
+    A trailing "(...)" or "[...]" after the song title is dropped, as in "Artist - Song (Official Video)".
+    """
+    positions = [i for i in (title.find(sep, 1) for sep in separators) if i != -1]
+    if not positions:
+        return None
+    split = min(positions)
+    song = title[split + 1:].lstrip()
+    if not song:
+        return None
+    for opener, closer in ('()', '[]'):
+        if song.endswith(closer):
+            start = song.find(opener, 1)
+            if start != -1:
+                song = song[:start]
+            break
+    return title[:split], song
+
+# yt_dlp is imported inside the methods that use it: it is slow to import and only
+# needed for the no-API-key search fallback and direct stream lookups
 
 class YouTubeClient:
     """Client for searching and streaming YouTube videos"""
     
-    def __init__(self):
+    def __init__(self, session: Optional[requests.Session] = None):
         self.api_key = os.getenv('YOUTUBE_API_KEY', '')
         self.base_url = 'https://www.googleapis.com/youtube/v3'
+        # Reused for every API call so the TLS connection stays open between searches
+        self._session = session or pooled_session(pool_connections=4, pool_maxsize=16)
+        # Idle YoutubeDL instances by kind, see _borrow_ydl
+        self._idle_ydls = {}
+        self._ydls_lock = threading.Lock()
+        # video_url (or search key) -> (fetched at, value), least recently used first
+        self._stream_cache = OrderedDict()
+        self._info_cache = OrderedDict()
+        self._search_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # Backs the in-memory caches across restarts, keyed by kind and key
+        self._disk = DiskCache(DISK_CACHE_PATH)
         
         # Configure yt-dlp
         self.ydl_opts = {
@@ -24,10 +96,20 @@ class YouTubeClient:
     
     def search(self, query: str, max_results: int = 20) -> List[Dict]:
         """Search for music videos on YouTube"""
+        key = f"{max_results}:{query.strip().lower()}"
+        cached = self._cache_get(self._search_cache, 'search', key, SEARCH_CACHE_TTL)
+        if cached:
+            # Copies, so callers can't modify what's cached
+            return [dict(result) for result in cached]
+        
         if self.api_key:
-            return self._search_with_api(query, max_results)
+            results = self._search_with_api(query, max_results)
         else:
-            return self._search_with_yt_dlp(query, max_results)
+            results = self._search_with_yt_dlp(query, max_results)
+        # Failed searches come back empty; don't keep those
+        if results:
+            self._cache_put(self._search_cache, 'search', key, results)
+        return [dict(result) for result in results]
     
     def _search_with_api(self, query: str, max_results: int) -> List[Dict]:
         """Search using YouTube Data API"""
@@ -39,49 +121,44 @@ class YouTubeClient:
                 'maxResults': max_results,
                 'order': 'relevance',
                 'videoCategoryId': '10',  # Music category
+                # Only what _parse_api_results reads; the rest of each snippet is never used
+                'fields': 'items(id/videoId,snippet(title,channelTitle,description,publishedAt,thumbnails/default/url))',
                 'key': self.api_key
             }
             
-            response = requests.get(
+            response = self._session.get(
                 f'{self.base_url}/search',
                 params=params,
                 timeout=10
             )
             
             if response.status_code == 200:
-                data = response.json()
+                data = loads(response.content)
                 return self._parse_api_results(data)
             else:
-                print(f"YouTube API search failed: {response.status_code}")
+                logger.warning("YouTube API search failed: %s", response.status_code)
                 return []
                 
         except Exception as e:
-            print(f"Error searching YouTube API: {e}")
+            logger.warning("Error searching YouTube API: %s", e)
             return []
     
     def _search_with_yt_dlp(self, query: str, max_results: int) -> List[Dict]:
         """Search using yt-dlp (fallback when no API key)"""
         try:
-            search_opts = {
-                'quiet': True,
-                'no_warnings': True,
-                'extract_flat': True,
-                'playlistend': max_results,
-            }
-            
-            with yt_dlp.YoutubeDL(search_opts) as ydl:
+            with self._borrow_ydl('search', SEARCH_YDL_OPTS) as ydl:
                 search_results = ydl.extract_info(
                     f"ytsearch{max_results}:{query} music",
                     download=False
                 )
-                
-                if search_results and 'entries' in search_results:
-                    return self._parse_yt_dlp_results(search_results['entries'])
-                else:
-                    return []
+            
+            if search_results and 'entries' in search_results:
+                return self._parse_yt_dlp_results(search_results['entries'])
+            else:
+                return []
                     
         except Exception as e:
-            print(f"Error searching with yt-dlp: {e}")
+            logger.warning("Error searching with yt-dlp: %s", e)
             return []
     
     def _parse_api_results(self, data: Dict) -> List[Dict]:
@@ -140,89 +217,181 @@ class YouTubeClient:
         
         return results
     
-    def _parse_video_title(self, title: str) -> Dict[str, str]:
-        """Try to extract artist and song title from video title"""
-        # Common patterns for music videos
-        patterns = [
-            r'^(.+?)\s*[-–—]\s*(.+?)(?:\s*\(.*\)|\s*\[.*\])?$',  # Artist - Title
-            r'^(.+?)\s*[:\|]\s*(.+?)(?:\s*\(.*\)|\s*\[.*\])?$',   # Artist : Title or Artist | Title
-            r'^(.+?)\s*"(.+?)"',  # Artist "Title"
-            r'^(.+?)\s*–\s*(.+?)(?:\s*\(.*\)|\s*\[.*\])?$',      # Artist – Title (em dash)
-        ]
-        
-        for pattern in patterns:
-            match = re.match(pattern, title.strip())
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _parse_video_title(title: str) -> Dict[str, str]:
+        """Try to extract artist and song title from video title.
+        Memoized since popular titles recur across searches; callers only read the result.
+        """
+        stripped = title.strip()
+        parts = None
+        for separators in _TITLE_SEPARATORS:
+            parts = _split_title(stripped, separators)
+            if parts:
+                break
+        else:
+            match = '"' in stripped and _QUOTED_TITLE_RE.match(stripped)
             if match:
-                return {
-                    'artist': match.group(1).strip(),
-                    'title': match.group(2).strip()
-                }
+                parts = match.groups()
+        if parts:
+            artist, song = parts
+            return {
+                'artist': artist.strip(),
+                'title': song.strip()
+            }
         
         # If no pattern matches, return the whole title as both
         return {
             'artist': 'Unknown Artist',
-            'title': title.strip()
+            'title': stripped
         }
     
+    @contextmanager
+    def _borrow_ydl(self, kind: str, opts: Dict):
+        """Lend an idle YoutubeDL of this kind, building one if none is free.
+        Instances aren't thread-safe, so each is used by one caller at a time; at most
+        YDL_POOL_SIZE per kind are kept for the next caller, whichever thread it runs on.
+        """
+        with self._ydls_lock:
+            idle = self._idle_ydls.setdefault(kind, [])
+            ydl = idle.pop() if idle else None
+        if ydl is None:
+            import yt_dlp
+            ydl = yt_dlp.YoutubeDL(opts)
+        try:
+            yield ydl
+        finally:
+            with self._ydls_lock:
+                idle = self._idle_ydls.setdefault(kind, [])
+                keep = len(idle) < YDL_POOL_SIZE
+                if keep:
+                    idle.append(ydl)
+            if not keep:
+                ydl.close()
+    
+    def close(self):
+        """Close the idle YoutubeDL instances; call when the client is no longer needed"""
+        with self._ydls_lock:
+            pools, self._idle_ydls = self._idle_ydls, {}
+        for ydls in pools.values():
+            for ydl in ydls:
+                ydl.close()
+        self._disk.close()
+    
+    def _cache_get(self, cache: OrderedDict, kind: str, key: str, ttl: float):
+        """Return a cached value younger than ttl seconds, from memory or else from disk, or None"""
+        with self._cache_lock:
+            entry = cache.get(key)
+            if entry and time.monotonic() - entry[0] < ttl:
+                cache.move_to_end(key)
+                return entry[1]
+        
+        stored = self._disk.get(f"{kind}:{key}", ttl)
+        if stored is None:
+            return None
+        age, value = stored
+        # Keeps its original fetch time, so it still expires on schedule
+        self._cache_put(cache, kind, key, value, age=age, persist=False)
+        return value
+    
+    def _cache_put(self, cache: OrderedDict, kind: str, key: str, value, age: float = 0.0, persist: bool = True):
+        """Store a value, evicting the least recently used entry when full, and write it through to disk"""
+        with self._cache_lock:
+            cache[key] = (time.monotonic() - age, value)
+            cache.move_to_end(key)
+            if len(cache) > LOOKUP_CACHE_SIZE:
+                cache.popitem(last=False)
+        if persist:
+            self._disk.set(f"{kind}:{key}", value)
+    
     def get_stream_url(self, video_url: str) -> Optional[str]:
         """Get direct stream URL for a YouTube video"""
+        cached = self._cache_get(self._stream_cache, 'stream', video_url, STREAM_CACHE_TTL)
+        if cached:
+            return cached
+        
         try:
-            with yt_dlp.YoutubeDL(self.ydl_opts) as ydl:
+            with self._borrow_ydl('stream', self.ydl_opts) as ydl:
                 info = ydl.extract_info(video_url, download=False)
-                
-                # Get the best audio format
-                formats = info.get('formats', [])
-                audio_formats = [f for f in formats if f.get('acodec') != 'none']
-                
-                if audio_formats:
-                    # Sort by quality and get the best one
-                    best_audio = max(audio_formats, key=lambda x: x.get('abr', 0))
-                    return best_audio.get('url')
-                
-                return None
+            
+            # Highest-bitrate format that has audio, in one pass; abr can be missing or None
+            formats = info.get('formats') or []
+            best_audio = max(
+                (f for f in formats if f.get('acodec') != 'none'),
+                key=lambda x: x.get('abr') or 0,
+                default=None
+            )
+            
+            url = best_audio and best_audio.get('url')
+            if url:
+                self._cache_put(self._stream_cache, 'stream', video_url, url)
+            return url
                 
         except Exception as e:
-            print(f"Error getting stream URL: {e}")
+            logger.warning("Error getting stream URL: %s", e)
             return None
     
+    def get_stream_urls(self, video_urls: List[str], workers: int = 8) -> List[Optional[str]]:
+        """Get direct stream URLs for several videos concurrently, in the order given"""
+        if not video_urls:
+            return []
+        with ThreadPoolExecutor(max_workers=min(workers, len(video_urls))) as executor:
+            return list(executor.map(self.get_stream_url, video_urls))
+    
     def get_video_info(self, video_url: str) -> Optional[Dict]:
         """Get detailed information about a YouTube video"""
+        cached = self._cache_get(self._info_cache, 'info', video_url, INFO_CACHE_TTL)
+        if cached:
+            return dict(cached)
+        
         try:
-            with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True}) as ydl:
+            with self._borrow_ydl('info', {'quiet': True, 'no_warnings': True}) as ydl:
                 info = ydl.extract_info(video_url, download=False)
-                
-                title_parts = self._parse_video_title(info.get('title', ''))
-                
-                return {
-                    'id': info.get('id'),
-                    'title': title_parts.get('title', info.get('title')),
-                    'artist': title_parts.get('artist', info.get('uploader')),
-                    'album': 'YouTube',
-                    'duration': info.get('duration', 0),
-                    'view_count': info.get('view_count', 0),
-                    'like_count': info.get('like_count', 0),
-                    'upload_date': info.get('upload_date'),
-                    'description': info.get('description', ''),
-                    'thumbnail': info.get('thumbnail'),
-                    'url': video_url,
-                    'source': 'youtube'
-                }
+            
+            title_parts = self._parse_video_title(info.get('title', ''))
+            
+            details = {
+                'id': info.get('id'),
+                'title': title_parts.get('title', info.get('title')),
+                'artist': title_parts.get('artist', info.get('uploader')),
+                'album': 'YouTube',
+                'duration': info.get('duration', 0),
+                'view_count': info.get('view_count', 0),
+                'like_count': info.get('like_count', 0),
+                'upload_date': info.get('upload_date'),
+                'description': info.get('description', ''),
+                'thumbnail': info.get('thumbnail'),
+                'url': video_url,
+                'source': 'youtube'
+            }
+            self._cache_put(self._info_cache, 'info', video_url, details)
+            return dict(details)
                 
         except Exception as e:
-            print(f"Error getting video info: {e}")
+            logger.warning("Error getting video info: %s", e)
             return None
     
+    def get_video_infos(self, video_urls: List[str], workers: int = 8) -> List[Optional[Dict]]:
+        """Get information about several videos concurrently, in the order given"""
+        if not video_urls:
+            return []
+        with ThreadPoolExecutor(max_workers=min(workers, len(video_urls))) as executor:
+            return list(executor.map(self.get_video_info, video_urls))
+    
     def download_audio(self, video_url: str, output_path: str = None) -> Optional[str]:
         """Download audio from YouTube video"""
         try:
-            download_opts = self.ydl_opts.copy()
-            if output_path:
-                download_opts['outtmpl'] = output_path
+            if not output_path:
+                # Default template: same options as stream lookups, so reuse that instance
+                with self._borrow_ydl('stream', self.ydl_opts) as ydl:
+                    info = ydl.extract_info(video_url, download=True)
+                    return ydl.prepare_filename(info)
             
-            with yt_dlp.YoutubeDL(download_opts) as ydl:
+            import yt_dlp
+            with yt_dlp.YoutubeDL({**self.ydl_opts, 'outtmpl': output_path}) as ydl:
                 info = ydl.extract_info(video_url, download=True)
                 return ydl.prepare_filename(info)
                 
         except Exception as e:
-            print(f"Error downloading audio: {e}")
+            logger.warning("Error downloading audio: %s", e)
             return None